@@ -0,0 +1,75 @@
+""" Benchmark of the decoding of the responses: full JSON tree vs compact model
+
+Usage: python benchmarks/bench_decode.py [--communes 500] [--payload payload.json]
+"""
+import argparse
+import gc
+import json
+import pathlib
+import sys
+import timeit
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# pylint: disable=wrong-import-position
+from homeassistant.util.json import json_loads  # noqa: E402
+
+from custom_components.recosante.api import JSON_PATHS  # noqa: E402
+from custom_components.recosante.model import RecosanteData  # noqa: E402
+
+DEFAULT_PAYLOAD = ROOT / "benchmarks" / "payloads" / "recosante.json"
+
+
+def legacy_decode(body: bytes) -> tuple[dict, RecosanteData]:
+    """Decoding before the compact model: the JSON tree is kept with the data"""
+    payload = json.loads(body)
+    return payload, RecosanteData.from_json(payload)
+
+
+def compact_decode(body: bytes) -> RecosanteData:
+    """Decoding of RecosanteDataApi.get_data"""
+    return RecosanteData.from_json(json_loads(body), paths=JSON_PATHS)
+
+
+def retained_bytes(decode, bodies: list[bytes]) -> int:
+    """Memory held by the data of every commune once decoded"""
+    gc.collect()
+    tracemalloc.start()
+    data = [decode(body) for body in bodies]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--communes", type=int, default=500)
+    parser.add_argument("--payload", type=pathlib.Path, default=DEFAULT_PAYLOAD)
+    args = parser.parse_args()
+
+    payload = json.loads(args.payload.read_text(encoding="utf-8"))
+    # One distinct body per commune, as when hundreds of communes are loaded
+    bodies = [
+        json.dumps({**payload, "commune": f"{i:05d}"}).encode()
+        for i in range(args.communes)
+    ]
+
+    number = 1000
+    results = {"communes": args.communes, "payload_bytes": len(bodies[0])}
+    for name, decode in (("legacy", legacy_decode), ("compact", compact_decode)):
+        results[f"{name}_decode_us"] = round(
+            timeit.timeit(lambda: decode(bodies[0]), number=number) / number * 1e6,
+            3,
+        )
+        retained = retained_bytes(decode, bodies)
+        results[f"{name}_retained_bytes"] = retained
+        results[f"{name}_bytes_per_commune"] = retained // args.communes
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
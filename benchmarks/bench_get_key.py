@@ -0,0 +1,103 @@
+""" Micro-benchmark of the sensor lookups: linear scan vs indexed model
+
+Usage: python benchmarks/bench_get_key.py [payload.json]
+"""
+import json
+import pathlib
+import sys
+import timeit
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# pylint: disable=wrong-import-position
+from custom_components.recosante.const import (  # noqa: E402
+    ATMO_SENSORS,
+    METEO_SENSORS,
+    POLLUTION_SENSORS,
+    RADON_SENSORS,
+    RAEP_SENSORS,
+    UV_SENSORS,
+)
+from custom_components.recosante.model import RecosanteData  # noqa: E402
+
+DEFAULT_PAYLOAD = ROOT / "benchmarks" / "payloads" / "recosante.json"
+SENSORS = (
+    ATMO_SENSORS
+    + METEO_SENSORS
+    + POLLUTION_SENSORS
+    + RADON_SENSORS
+    + RAEP_SENSORS
+    + UV_SENSORS
+)
+
+
+def legacy_get_key(data, key_category, key_array, key):
+    """get_key as implemented before the indexed model"""
+    if data is not None and key_category in data:
+        if key_array in data.get(key_category).get("indice"):
+            for a in data.get(key_category).get("indice")[key_array]:
+                if a["label"] == key:
+                    return a.get("indice") if "indice" in a else a
+            return None
+        else:
+            return data.get(key_category).get("indice")
+    else:
+        return None
+
+
+def legacy_state_write(data):
+    """One state write of every sensor: native_value + extra_state_attributes"""
+    for description in SENSORS:
+        keys = description.json_keys
+        legacy_get_key(data, keys.category, keys.array, keys.label)
+        legacy_get_key(data, keys.category, keys.array, keys.label)
+
+
+def indexed_state_write(data: RecosanteData):
+    """One state write of every sensor: native_value + extra_state_attributes"""
+    for description in SENSORS:
+        keys = description.json_keys
+        data.get_key(keys.category, keys.array, keys.label)
+        data.get_key(keys.category, keys.array, keys.label)
+
+
+def main():
+    path = pathlib.Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PAYLOAD
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    indexed = RecosanteData.from_json(payload)
+
+    for description in SENSORS:
+        keys = description.json_keys
+        legacy = legacy_get_key(payload, keys.category, keys.array, keys.label) or {}
+        assert (
+            legacy.get("value", legacy.get("level")),
+            legacy.get("label"),
+        ) == (
+            indexed.get_value(keys.category, keys.array, keys.label),
+            indexed.get_label(keys.category, keys.array, keys.label),
+        ), keys
+
+    number = 10000
+    results = {
+        "legacy_state_write_us": timeit.timeit(
+            lambda: legacy_state_write(payload), number=number
+        )
+        / number
+        * 1e6,
+        "indexed_state_write_us": timeit.timeit(
+            lambda: indexed_state_write(indexed), number=number
+        )
+        / number
+        * 1e6,
+        "indexed_parse_us": timeit.timeit(
+            lambda: RecosanteData.from_json(payload), number=number
+        )
+        / number
+        * 1e6,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+""" Benchmark d'endurance de la mémoire d'un grand parc de communes, hors ligne
+
+Usage: python benchmarks/bench_memory.py [--communes 1000] [--rounds 5]
+       [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from harness import (
+    async_create_hass,
+    async_stop_hass,
+    create_entry,
+    environment,
+    insee_codes,
+    use_fake_api,
+)
+from fake_api import FakeApi
+
+# pylint: disable=wrong-import-position,wrong-import-order
+from custom_components.recosante import RecosanteApiCoordinator  # noqa: E402
+from custom_components.recosante.archive import RecosanteArchive  # noqa: E402
+from custom_components.recosante.cache import RecosanteCache  # noqa: E402
+from custom_components.recosante.const import DEFAULT_CATEGORIES  # noqa: E402
+from custom_components.recosante.descriptions import (  # noqa: E402
+    EntryNames,
+    sensors_of,
+)
+from custom_components.recosante.memory import instances_sizeof  # noqa: E402
+from custom_components.recosante.ratelimit import RateLimiter  # noqa: E402
+from custom_components.recosante.sensor import RecosanteEntity  # noqa: E402
+from homeassistant.core import CoreState  # noqa: E402
+from homeassistant.helpers.entity import DeviceInfo  # noqa: E402
+
+# Requests are not spaced out, only the memory is measured
+UNLIMITED = 1_000_000
+
+
+def _traced() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def async_bench(communes: int, rounds: int) -> dict:
+    """Set up a fleet of communes, then refresh it again and again"""
+    fake = FakeApi()
+    use_fake_api(await fake.start())
+    result: dict = {"communes": communes}
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        hass.state = CoreState.running
+        coordinator = RecosanteApiCoordinator(
+            hass, cache=RecosanteCache(hass), archive=RecosanteArchive(hass)
+        )
+        coordinator.limiter = RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED)
+        entries = [create_entry(insee_code) for insee_code in insee_codes(communes)]
+
+        tracemalloc.start()
+        baseline = _traced()
+        await asyncio.gather(
+            *(coordinator.async_register_entry(entry) for entry in entries)
+        )
+        await coordinator.async_refresh()
+        result["data_bytes_per_commune"] = (_traced() - baseline) // communes
+
+        before_entities = _traced()
+        entities = []
+        for entry in entries:
+            # The sensors of an entry share their device info, as in sensor.py
+            device_info = DeviceInfo(
+                manufacturer="Benchmark", identifiers={("recosante", entry.entry_id)}
+            )
+            names = EntryNames.from_entry(entry)
+            entities += [
+                RecosanteEntity(names, sensor, coordinator, device_info)
+                for sensor in sensors_of(DEFAULT_CATEGORIES)
+            ]
+        for entity in entities:
+            _ = entity.native_value
+            _ = entity.extra_state_attributes
+        result["entities"] = len(entities)
+        result["entity_bytes_per_commune"] = (_traced() - before_entities) // communes
+
+        # Memory must not grow from one refresh to the next
+        samples = []
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await coordinator.async_refresh()
+            for entity in entities:
+                _ = entity.native_value
+                _ = entity.extra_state_attributes
+            samples.append(_traced() - baseline)
+        result["soak_s"] = round(time.perf_counter() - start, 3)
+        result["total_bytes_per_commune"] = samples[-1] // communes
+        result["growth_bytes"] = samples[-1] - samples[0]
+        tracemalloc.stop()
+
+        # What the diagnostics report, for comparison with tracemalloc
+        reported = [
+            coordinator.memory_usage(insee_code) for insee_code in insee_codes(communes)
+        ]
+        result["reported_bytes_per_commune"] = {
+            key: sum(report[key] for report in reported) // communes
+            for key in reported[0]
+        }
+        result["reported_entity_bytes_per_commune"] = (
+            instances_sizeof(entities) // communes
+        )
+        result["refresh_success"] = coordinator.last_update_success
+        result.update(fake.stats())
+        await coordinator.async_shutdown()
+        await async_stop_hass(hass)
+    await fake.stop()
+    return result
+
+
+async def async_main(args) -> dict:
+    """Run the soak test"""
+    return {
+        "benchmark": "memory",
+        "environment": environment(),
+        "rounds": args.rounds,
+        "results": [await async_bench(args.communes, args.rounds)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--communes", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    args = parser.parse_args()
+
+    results = asyncio.run(async_main(args))
+    json.dump(results, args.output, indent=2)
+    args.output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
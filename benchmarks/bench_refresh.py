@@ -0,0 +1,149 @@
+""" Benchmark du chemin complet API -> coordinateur -> capteurs, hors ligne
+
+Usage: python benchmarks/bench_refresh.py [--communes 1 50 500] [--latency 0.05]
+       [--failure-rate 0.0] [--host-rate 10] [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+
+from harness import (
+    async_create_hass,
+    async_stop_hass,
+    create_entry,
+    environment,
+    insee_codes,
+    use_fake_api,
+)
+from fake_api import FakeApi
+
+# pylint: disable=wrong-import-position,wrong-import-order
+from custom_components.recosante import RecosanteApiCoordinator  # noqa: E402
+from custom_components.recosante.api import INSEEAPI  # noqa: E402
+from custom_components.recosante.archive import RecosanteArchive  # noqa: E402
+from custom_components.recosante.cache import RecosanteCache  # noqa: E402
+from custom_components.recosante.const import RATE_LIMIT_HOST_RATE  # noqa: E402
+from custom_components.recosante.descriptions import (  # noqa: E402
+    COMPILED_SENSORS,
+    EntryNames,
+)
+from custom_components.recosante.ratelimit import RateLimiter  # noqa: E402
+from custom_components.recosante.sensor import RecosanteEntity  # noqa: E402
+from homeassistant.core import CoreState  # noqa: E402
+from homeassistant.helpers.entity import DeviceInfo  # noqa: E402
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+async def async_bench(
+    communes: int, latency: float, failure_rate: float, host_rate: float
+) -> dict:
+    """Measure one fleet size"""
+    fake = FakeApi(latency, failure_rate)
+    use_fake_api(await fake.start())
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        # Entries set up once started fetch their data right away
+        hass.state = CoreState.running
+        coordinator = RecosanteApiCoordinator(
+            hass, cache=RecosanteCache(hass), archive=RecosanteArchive(hass)
+        )
+        # Same burst as the default limiter, scaled with the rate
+        coordinator.limiter = RateLimiter(
+            rate=2 * host_rate,
+            burst=4 * host_rate,
+            host_rate=host_rate,
+            host_burst=2 * host_rate,
+        )
+        entries = [create_entry(insee_code) for insee_code in insee_codes(communes)]
+        result = {"communes": communes}
+
+        start = time.perf_counter()
+        setups = await asyncio.gather(
+            *(coordinator.async_register_entry(entry) for entry in entries),
+            return_exceptions=True,
+        )
+        result["first_fetch_ms"] = _ms(start)
+        result["entries_not_ready"] = sum(
+            isinstance(setup, Exception) for setup in setups
+        )
+
+        start = time.perf_counter()
+        device_info = DeviceInfo(manufacturer="Benchmark")
+        entities = [
+            RecosanteEntity(
+                EntryNames.from_entry(entry), sensor, coordinator, device_info
+            )
+            for entry, setup in zip(entries, setups)
+            if not isinstance(setup, Exception)
+            for sensor in COMPILED_SENSORS
+        ]
+        result["entity_creation_ms"] = _ms(start)
+        result["entities"] = len(entities)
+
+        start = time.perf_counter()
+        await coordinator.async_refresh()
+        result["refresh_ms"] = _ms(start)
+        result["refresh_success"] = coordinator.last_update_success
+        result["rate_limit_wait_s"] = coordinator.limiter.as_dict()["waited_s"]
+
+        start = time.perf_counter()
+        for entity in entities:
+            _ = entity.native_value
+            _ = entity.extra_state_attributes
+        result["fan_out_ms"] = _ms(start)
+
+        start = time.perf_counter()
+        client = INSEEAPI()
+        try:
+            await client.get_data("69001")
+        except ValueError:
+            pass
+        await client.close()
+        result["insee_lookup_ms"] = _ms(start)
+
+        result.update(fake.stats())
+        await coordinator.async_shutdown()
+        await async_stop_hass(hass)
+    await fake.stop()
+    return result
+
+
+async def async_main(args) -> dict:
+    """Run every fleet size"""
+    return {
+        "benchmark": "refresh",
+        "environment": environment(),
+        "latency_s": args.latency,
+        "failure_rate": args.failure_rate,
+        "host_rate": args.host_rate,
+        "results": [
+            await async_bench(communes, args.latency, args.failure_rate, args.host_rate)
+            for communes in args.communes
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--communes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--host-rate", type=float, default=RATE_LIMIT_HOST_RATE)
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    args = parser.parse_args()
+
+    results = asyncio.run(async_main(args))
+    json.dump(results, args.output, indent=2)
+    args.output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+""" Benchmark de la mise en place des capteurs : descriptions lues à chaque entité vs table compilée
+
+Usage: python benchmarks/bench_setup.py [--communes 1 50 500] [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import sys
+import tempfile
+import time
+
+from harness import (
+    ROOT,
+    async_create_hass,
+    async_stop_hass,
+    create_entry,
+    environment,
+    insee_codes,
+)
+
+# pylint: disable=wrong-import-position,wrong-import-order
+from custom_components.recosante import RecosanteApiCoordinator  # noqa: E402
+from custom_components.recosante.api import JSON_PATHS  # noqa: E402
+from custom_components.recosante.archive import RecosanteArchive  # noqa: E402
+from custom_components.recosante.cache import RecosanteCache  # noqa: E402
+from custom_components.recosante.const import (  # noqa: E402
+    ATTRIBUTION,
+    CONF_CATEGORIES,
+    CONF_CITY,
+    CONF_INSEE_CODE,
+    DEFAULT_CATEGORIES,
+    FORECAST_CATEGORIES,
+    SENSORS,
+)
+from custom_components.recosante.descriptions import (  # noqa: E402
+    EntryNames,
+    sensors_of,
+)
+from custom_components.recosante.model import RecosanteData  # noqa: E402
+from custom_components.recosante.sensor import RecosanteEntity  # noqa: E402
+from homeassistant.helpers.entity import DeviceInfo  # noqa: E402
+from homeassistant.helpers.update_coordinator import CoordinatorEntity  # noqa: E402
+
+DEFAULT_PAYLOAD = ROOT / "benchmarks" / "payloads" / "recosante.json"
+REPEAT = 5
+_SENSOR_LOGGER = logging.getLogger("custom_components.recosante.sensor")
+
+
+class LegacyEntity(RecosanteEntity):
+    """RecosanteEntity before the compiled descriptions"""
+
+    # pylint: disable=super-init-not-called,non-parent-init-called
+    def __init__(self, entry_infos, description, coordinator, device_info) -> None:
+        CoordinatorEntity.__init__(self, coordinator)
+        self.entity_description = description
+        self._attr_name = f"{description.name} - {entry_infos.data.get(CONF_CITY)}"
+        self._attr_unique_id = f"{entry_infos.entry_id} - {entry_infos.data.get(CONF_INSEE_CODE)} - {description.name}"
+        self._insee_code = entry_infos.data.get(CONF_INSEE_CODE)
+        self._attr_attribution = f"{ATTRIBUTION} - {device_info['manufacturer']}"
+        self._attr_device_info = device_info
+        self._forecast = description.json_keys.category in FORECAST_CATEGORIES
+        self._state_data = None
+        self._state_version = 0
+        self._state = (None, None)
+        _SENSOR_LOGGER.debug("Creating a Recosanté sensor, named %s", self._attr_name)
+
+    def _compute_state(self, data: RecosanteData) -> tuple:
+        json_keys = self.entity_description.json_keys
+        value = data.get_value(json_keys.category, json_keys.array, json_keys.label)
+        _SENSOR_LOGGER.debug("Value for sensor %s is now %s", self._attr_name, value)
+        (forecast_start, forecast_end) = data.get_forecast_dates(json_keys.category)
+        attributes = {
+            "forecast_start": forecast_start,
+            "forecast_end": forecast_end,
+            "label": data.get_label(
+                json_keys.category, json_keys.array, json_keys.label
+            ),
+            "area_validity": data.get_validity(json_keys.category),
+        }
+        if self._forecast:
+            attributes["forecast"] = self.coordinator.get_forecast(
+                self._insee_code, self.entity_description.key
+            )
+        return value, attributes
+
+
+def legacy_entities(entries, coordinator, device_info) -> list:
+    """Entities of every entry, as created before the compiled descriptions"""
+    entities = []
+    for entry in entries:
+        categories = entry.options.get(CONF_CATEGORIES, DEFAULT_CATEGORIES)
+        entities += [
+            LegacyEntity(entry, description, coordinator, device_info)
+            for description in SENSORS
+            if description.json_keys.category in categories
+        ]
+    return entities
+
+
+def compiled_entities(entries, coordinator, device_info) -> list:
+    """Entities of every entry, created from the compiled table"""
+    entities = []
+    for entry in entries:
+        categories = entry.options.get(CONF_CATEGORIES, DEFAULT_CATEGORIES)
+        names = EntryNames.from_entry(entry)
+        entities += [
+            RecosanteEntity(names, sensor, coordinator, device_info)
+            for sensor in sensors_of(categories)
+        ]
+    return entities
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+async def async_bench(communes: int, data: RecosanteData) -> dict:
+    """Measure one fleet size"""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        coordinator = RecosanteApiCoordinator(
+            hass, cache=RecosanteCache(hass), archive=RecosanteArchive(hass)
+        )
+        entries = [create_entry(insee_code) for insee_code in insee_codes(communes)]
+        coordinator.data = {
+            entry.data[CONF_INSEE_CODE]: RecosanteData(categories=data.categories)
+            for entry in entries
+        }
+        device_info = DeviceInfo(manufacturer="Benchmark")
+        result = {"communes": communes}
+        for name, create in (
+            ("legacy", legacy_entities),
+            ("compiled", compiled_entities),
+        ):
+            setup = values = float("inf")
+            # Best of a few runs, without the pauses of the garbage collector
+            gc.collect()
+            gc.disable()
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                entities = create(entries, coordinator, device_info)
+                setup = min(setup, _ms(start))
+                start = time.perf_counter()
+                for entity in entities:
+                    # pylint: disable-next=protected-access
+                    entity._compute_state(coordinator.data[entity._insee_code])
+                values = min(values, _ms(start))
+            gc.enable()
+            result[f"{name}_setup_ms"] = setup
+            result[f"{name}_values_ms"] = values
+        result["entities"] = len(entities)
+        await coordinator.async_shutdown()
+        await async_stop_hass(hass)
+    return result
+
+
+async def async_main(args) -> dict:
+    """Run every fleet size"""
+    payload = json.loads(args.payload.read_text(encoding="utf-8"))
+    data = RecosanteData.from_json(payload, paths=JSON_PATHS)
+    return {
+        "benchmark": "setup",
+        "environment": environment(),
+        "results": [await async_bench(communes, data) for communes in args.communes],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--communes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--payload", type=ROOT.__class__, default=DEFAULT_PAYLOAD)
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    args = parser.parse_args()
+
+    results = asyncio.run(async_main(args))
+    json.dump(results, args.output, indent=2)
+    args.output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+""" Benchmark du démarrage : enregistrement des entrées pendant et après le démarrage
+
+Usage: python benchmarks/bench_startup.py [--communes 1 50 500] [--latency 0.05]
+       [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import tempfile
+import time
+
+from harness import (
+    async_create_hass,
+    async_stop_hass,
+    create_entry,
+    environment,
+    insee_codes,
+    use_fake_api,
+)
+from fake_api import FakeApi
+
+# pylint: disable=wrong-import-position,wrong-import-order
+from custom_components.recosante import RecosanteApiCoordinator  # noqa: E402
+from custom_components.recosante.archive import RecosanteArchive  # noqa: E402
+from custom_components.recosante.cache import RecosanteCache  # noqa: E402
+from homeassistant.const import EVENT_HOMEASSISTANT_STARTED  # noqa: E402
+from homeassistant.core import CoreState  # noqa: E402
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+async def async_register(communes: int, state: CoreState) -> dict:
+    """Register the entries of a fleet while Home Assistant is in a state"""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        hass.state = state
+        coordinator = RecosanteApiCoordinator(
+            hass, cache=RecosanteCache(hass), archive=RecosanteArchive(hass)
+        )
+        entries = [create_entry(insee_code) for insee_code in insee_codes(communes)]
+
+        # Do not count the garbage of the previous measure
+        gc.collect()
+        start = time.perf_counter()
+        setups = await asyncio.gather(
+            *(coordinator.async_register_entry(entry) for entry in entries),
+            return_exceptions=True,
+        )
+        result = {
+            "register_ms": _ms(start),
+            "entries_not_ready": sum(isinstance(setup, Exception) for setup in setups),
+        }
+
+        if state is not CoreState.running:
+            # The communes are fetched once Home Assistant has started
+            start = time.perf_counter()
+            hass.state = CoreState.running
+            hass.bus.async_fire(EVENT_HOMEASSISTANT_STARTED)
+            await hass.async_block_till_done()
+            result["startup_wave_ms"] = _ms(start)
+        result["communes_with_data"] = len(coordinator.data)
+
+        await coordinator.async_shutdown()
+        await async_stop_hass(hass)
+    return result
+
+
+async def async_bench(communes: int, latency: float) -> dict:
+    """Measure one fleet size, set up after and during startup"""
+    fake = FakeApi(latency, 0.0)
+    use_fake_api(await fake.start())
+    result = {
+        "communes": communes,
+        "running": await async_register(communes, CoreState.running),
+        "starting": await async_register(communes, CoreState.not_running),
+    }
+    await fake.stop()
+    return result
+
+
+async def async_main(args) -> dict:
+    """Run every fleet size"""
+    return {
+        "benchmark": "startup",
+        "environment": environment(),
+        "latency_s": args.latency,
+        "results": [
+            await async_bench(communes, args.latency) for communes in args.communes
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--communes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    args = parser.parse_args()
+
+    results = asyncio.run(async_main(args))
+    json.dump(results, args.output, indent=2)
+    args.output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
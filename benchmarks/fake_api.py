@@ -0,0 +1,95 @@
+""" Serveur local imitant les API Recosanté et geo.api.gouv.fr
+
+Usage: python benchmarks/fake_api.py [--port 8080] [--latency 0.05] [--failure-rate 0.1]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import pathlib
+import random
+
+from aiohttp import web
+
+PAYLOADS = pathlib.Path(__file__).resolve().parent / "payloads"
+
+
+class FakeApi:
+    """Serve recorded payloads with a configurable latency and failure rate"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        data_payload: pathlib.Path = PAYLOADS / "recosante.json",
+        communes_payload: pathlib.Path = PAYLOADS / "communes.json",
+    ) -> None:
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.data_body = data_payload.read_bytes()
+        self.communes_body = communes_payload.read_bytes()
+        self.requests = 0
+        self.failures = 0
+        self._runner: web.AppRunner | None = None
+        self.url: str | None = None
+
+    async def _respond(self, body: bytes) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.failures += 1
+            return web.Response(status=500, text="Internal Server Error")
+        return web.Response(body=body, content_type="application/json")
+
+    async def _handle_data(self, request: web.Request) -> web.Response:
+        if "insee" not in request.query:
+            return web.Response(status=400)
+        return await self._respond(self.data_body)
+
+    async def _handle_communes(self, request: web.Request) -> web.Response:
+        if "codePostal" not in request.query:
+            return web.Response(status=400)
+        return await self._respond(self.communes_body)
+
+    def app(self) -> web.Application:
+        """The aiohttp application"""
+        app = web.Application()
+        app.router.add_get("/v1/", self._handle_data)
+        app.router.add_get("/communes", self._handle_communes)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start the server, return its base URL"""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        """Stop the server"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> dict:
+        """Requests served since start"""
+        return {"requests": self.requests, "failures": self.failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeApi(args.latency, args.failure_rate)
+    web.run_app(fake.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+""" Outils communs aux benchmarks """
+from __future__ import annotations
+
+import pathlib
+import platform
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# pylint: disable=wrong-import-position
+from homeassistant.config_entries import ConfigEntry  # noqa: E402
+from homeassistant.const import __version__ as HA_VERSION  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from custom_components.recosante import api  # noqa: E402
+from custom_components.recosante.const import (  # noqa: E402
+    CONF_CITY,
+    CONF_INSEE_CODE,
+    DOMAIN,
+    TITLE,
+)
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    """Create a bare Home Assistant instance, without any integration"""
+    try:
+        hass = HomeAssistant(config_dir)  # pylint: disable=too-many-function-args
+    except TypeError:  # Home Assistant < 2024.2
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+    return hass
+
+
+async def async_stop_hass(hass: HomeAssistant) -> None:
+    """Stop the Home Assistant instance"""
+    await hass.async_stop(force=True)
+
+
+def use_fake_api(url: str) -> None:
+    """Send the requests of the integration to the fake API"""
+    api.DATA_URL = f"{url}/v1/?"
+    api.API_GOUV_URL = f"{url}/communes?"
+
+
+def create_entry(insee_code: str, options: dict | None = None) -> ConfigEntry:
+    """Config entry of a commune, as created by the config flow"""
+    city = f"Commune {insee_code}"
+    return ConfigEntry(
+        version=1,
+        domain=DOMAIN,
+        title=f"{TITLE} - {city}",
+        data={CONF_INSEE_CODE: insee_code, CONF_CITY: city},
+        source="user",
+        options=options or {},
+    )
+
+
+def insee_codes(count: int) -> list[str]:
+    """Distinct INSEE codes"""
+    return [f"{index:05d}" for index in range(1, count + 1)]
+
+
+def environment() -> dict:
+    """Versions the results were measured with"""
+    return {
+        "python": platform.python_version(),
+        "homeassistant": HA_VERSION,
+        "machine": platform.machine(),
+    }
@@ -1,19 +1,56 @@
 """ Les constantes pour l'intégration Recosanté """
+import asyncio
 import logging
+import time
+from collections.abc import Iterable
 from datetime import timedelta, date
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
-from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE, Platform
+from homeassistant.core import CALLBACK_TYPE, CoreState, Event, HomeAssistant, callback
+from homeassistant.config_entries import ConfigEntry, current_entry
+from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers.start import async_at_started
 from homeassistant.helpers.typing import ConfigType
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util
 
-from .api import RecosanteDataApi
+from .api import (
+    RecosanteApiError,
+    RecosanteCircuitOpenError,
+    RecosanteDataApi,
+    RecosanteRateLimitedError,
+    create_session,
+    data_host,
+)
+from .breaker import CircuitBreaker
+from .aggregates import compute_aggregates
+from .archive import RecosanteArchive, async_get_archive
+from .cache import RecosanteCache
+from .forecast import CommuneForecast
+from .memory import deep_sizeof, instances_sizeof
+from .model import EMPTY_DATA, RecosanteData
+from .ratelimit import PRIORITY_FORECAST, PRIORITY_FRESH, PRIORITY_STALE, RateLimiter
+from .regions import AreaIndex
+from .stats import FetchStats, RefreshStats
+from .summary import summary, summary_row
+from .scheduler import RefreshScheduler, is_stale
+from .services import CONFIG_SCHEMA, async_provision, async_setup_services
+from .websocket import async_setup_websocket
 from .const import (
     DOMAIN,
+    CACHE,
     COORDINATOR,
     UNDO_LISTENER,
     PLATFORMS,
+    CONF_CATEGORIES,
+    CONF_END,
     CONF_INSEE_CODE,
+    CONF_START,
+    DEFAULT_CATEGORIES,
+    EVENT_PUBLICATION,
+    FORECAST_CATEGORIES,
+    FORECAST_DAYS,
+    MAX_CONCURRENT_REQUESTS,
+    OPTIONAL_CATEGORIES,
     REFRESH_INTERVAL,
     NAME,
 )
@@ -21,6 +58,15 @@ from .const import (
 _LOGGER = logging.getLogger(__name__)
 
 
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Register the services and commands, and import the communes listed in YAML"""
+    async_setup_services(hass)
+    async_setup_websocket(hass)
+    if DOMAIN in config:
+        hass.async_create_task(async_provision(hass, config[DOMAIN]))
+    return True
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Initialisation from a config entry."""
     _LOGGER.info(
@@ -29,24 +75,27 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         PLATFORMS,
         entry,
     )
-    hass.data.setdefault(DOMAIN, {})
-    api = RecosanteDataApi(entry.data, hass=hass)
-
-    coordinator = RecosanteApiCoordinator(hass=hass, config=entry, api=api)
+    start = time.perf_counter()
+    coordinator = async_get_coordinator(hass)
 
-    await coordinator.async_config_entry_first_refresh()
+    try:
+        await coordinator.async_register_entry(entry)
+    except ConfigEntryNotReady:
+        # Do not keep the coordinator and its session for an entry retried later
+        await async_release_coordinator(hass)
+        raise
 
     # Add and update listener
     undo_listener = entry.add_update_listener(_async_update_listener)
 
     # Setup coordinator
-    hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.entry_id] = {
         COORDINATOR: coordinator,
         UNDO_LISTENER: undo_listener,
     }
 
     await hass.config_entries.async_forward_entry_setups(entry, [Platform.SENSOR])
+    coordinator.stats.add_setup(time.perf_counter() - start)
     _LOGGER.debug("Setup of %s successful", entry.title)
 
     return True
@@ -56,19 +105,76 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        entry_data = hass.data[DOMAIN].pop(entry.entry_id)
+        entry_data[UNDO_LISTENER]()
+        entry_data[COORDINATOR].async_unregister_entry(entry)
+        await async_release_coordinator(hass)
     return unload_ok
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Forget the cached data of a removed commune"""
+    insee_code = entry.data.get(CONF_INSEE_CODE)
+    for other in hass.config_entries.async_entries(DOMAIN):
+        if (
+            other.entry_id != entry.entry_id
+            and other.data.get(CONF_INSEE_CODE) == insee_code
+        ):
+            return
+    await _async_get_cache(hass).async_remove(insee_code)
+
+
+@callback
+def async_get_coordinator(hass: HomeAssistant) -> "RecosanteApiCoordinator":
+    """The coordinator shared by every entry of the domain, created if needed"""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if COORDINATOR not in domain_data:
+        # The coordinator is shared by all entries, do not bind it to the one
+        # being set up, which would shut it down when unloaded
+        token = current_entry.set(None)
+        try:
+            domain_data[COORDINATOR] = RecosanteApiCoordinator(
+                hass=hass,
+                cache=_async_get_cache(hass),
+                archive=async_get_archive(hass),
+            )
+        finally:
+            current_entry.reset(token)
+    return domain_data[COORDINATOR]
+
+
+async def async_release_coordinator(hass: HomeAssistant) -> None:
+    """Drop the shared coordinator once no entry uses it anymore"""
+    coordinator = hass.data.get(DOMAIN, {}).get(COORDINATOR)
+    if coordinator is not None and not coordinator.insee_codes:
+        hass.data[DOMAIN].pop(COORDINATOR)
+        await coordinator.async_shutdown()
+
+
+@callback
+def _async_get_cache(hass: HomeAssistant) -> RecosanteCache:
+    """The cache outlives the coordinator, which is dropped with the last entry"""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if CACHE not in domain_data:
+        domain_data[CACHE] = RecosanteCache(hass)
+    return domain_data[CACHE]
+
+
 async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry):
     """Update when config_entry options update"""
     await hass.config_entries.async_reload(entry.entry_id)
 
 
 class RecosanteApiCoordinator(DataUpdateCoordinator):
-    """A coordinator to fetch data from the API only once"""
+    """A coordinator to fetch data from the API for every commune at once"""
 
-    def __init__(self, hass, config: ConfigType, api):
+    def __init__(
+        self,
+        hass,
+        cache: RecosanteCache,
+        archive: RecosanteArchive,
+        max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+    ) -> None:
         super().__init__(
             hass,
             _LOGGER,
@@ -76,26 +182,602 @@ class RecosanteApiCoordinator(DataUpdateCoordinator):
             update_method=self._update_method,
             update_interval=timedelta(minutes=REFRESH_INTERVAL),
         )
-        self.config = config
         self.hass = hass
-        self.api = api
+        self.data = {}
+        # One pooled session shared by the clients of every commune, closed
+        # with the last entry or when Home Assistant stops
+        self._session = create_session()
+        self._unsub_close: CALLBACK_TYPE | None = hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_CLOSE, self._async_close_session
+        )
+        self.apis: dict[str, RecosanteDataApi] = {}
+        self.forecasts: dict[str, CommuneForecast] = {}
+        self._forecast_task: asyncio.Task | None = None
+        # Communes whose forecasts are fetched by the next run of the task
+        self._forecast_queue: set[str] = set()
+        self._entries: dict[str, str] = {}
+        # Entry IDs by INSEE code, several entries may track the same commune
+        self._communes: dict[str, set[str]] = {}
+        self._categories: dict[str, frozenset[str]] = {}
+        self._pending: dict[str, asyncio.Task] = {}
+        self._changes: dict[str, frozenset | None] = {}
+        # Last data and aggregates of every commune
+        self._aggregates: dict[str, tuple[RecosanteData, dict[str, tuple]]] = {}
+        self._summary_rows: dict[str, tuple[RecosanteData, tuple]] = {}
+        # Last validity window of every category, by INSEE code
+        self._windows: dict[str, dict[str, tuple]] = {}
+        self.skipped_writes = 0
+        self.stats = RefreshStats()
+        self._cache = cache
+        self._archive = archive
+        self._areas = AreaIndex()
+        # One circuit breaker per API host, shared by the clients of every commune
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._host = data_host()
+        # One rate limiter shared by the clients of every commune and host
+        self.limiter = RateLimiter()
+        self._scheduler = RefreshScheduler()
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._unsub_startup: CALLBACK_TYPE | None = None
 
-    async def _update_method(self):
-        data = await self.api.get_data(self.config.data[CONF_INSEE_CODE])
-        if data is not None and len(data) > 0:
+    @property
+    def starting(self) -> bool:
+        """Whether Home Assistant is still setting up its integrations"""
+        return self.hass.state in (CoreState.not_running, CoreState.starting)
+
+    @property
+    def insee_codes(self) -> set[str]:
+        """INSEE codes of all the registered entries, without duplicates"""
+        return set(self._communes)
+
+    async def async_register_entry(self, entry: ConfigEntry) -> None:
+        """Register an entry and make sure data is available for its commune"""
+        insee_code = entry.data[CONF_INSEE_CODE]
+        self._entries[entry.entry_id] = insee_code
+        self._communes.setdefault(insee_code, set()).add(entry.entry_id)
+        self._categories[entry.entry_id] = frozenset(
+            entry.options.get(CONF_CATEGORIES, DEFAULT_CATEGORIES)
+        )
+        categories = self._commune_categories(insee_code)
+        if insee_code not in self.apis:
+            self.apis[insee_code] = self._create_api(insee_code, categories)
+        elif categories != self.apis[insee_code].categories:
+            if not categories <= self.apis[insee_code].categories:
+                # New categories are requested, data has to be fetched again
+                self.data = {
+                    code: data for code, data in self.data.items() if code != insee_code
+                }
+            self.apis[insee_code].categories = categories
+        if insee_code in self.data:
+            return
+
+        cached = await self._cache.async_get(insee_code, categories)
+        if insee_code in self.data:
+            return
+        if self.starting:
+            # Do not hold up Home Assistant: the entities start from the cached
+            # data, or unavailable, and every commune is fetched in one wave
+            # once Home Assistant has started
+            if cached is not None:
+                self._changes[insee_code] = None
+                self.data = {**self.data, insee_code: cached.data}
+            if self._unsub_startup is None:
+                self._unsub_startup = async_at_started(
+                    self.hass, self._async_startup_wave
+                )
+            return
+        if (
+            cached is not None
+            and not cached.stale
+            and categories & OPTIONAL_CATEGORIES.keys() <= cached.data.categories.keys()
+        ):
+            # Create the entities right away, fresh data of this commune only
+            # is fetched in background
+            self._changes[insee_code] = None
+            self.data = {**self.data, insee_code: cached.data}
+            self.hass.async_create_task(self._async_refresh_commune(insee_code))
+            return
+
+        # Entries set up at the same time for the same commune share one fetch
+        if insee_code not in self._pending:
+            self._pending[insee_code] = self.hass.async_create_task(
+                self._async_fetch(insee_code)
+            )
+        try:
+            data = await self._pending[insee_code]
+        finally:
+            self._pending.pop(insee_code, None)
+
+        if data is None and cached is not None:
+            _LOGGER.warning(
+                "Using stale cached data for INSEE %s, fetched on %s",
+                insee_code,
+                cached.fetched,
+            )
+            data = cached.data
+        if data is None:
+            self.async_unregister_entry(entry)
+            raise ConfigEntryNotReady(
+                f'No Data from Recosanté for INSEE code {insee_code} and date {date.today().strftime("%Y-%m-%d")}'
+            )
+        self._changes[insee_code] = None
+        self.data = {**self.data, insee_code: self._compose(insee_code, data)}
+
+    @callback
+    def async_unregister_entry(self, entry: ConfigEntry) -> bool:
+        """Unregister an entry, return whether entries are still registered"""
+        insee_code = self._entries.pop(entry.entry_id, None)
+        self._categories.pop(entry.entry_id, None)
+        if entry_ids := self._communes.get(insee_code):
+            entry_ids.discard(entry.entry_id)
+            if not entry_ids:
+                self._communes.pop(insee_code)
+        if insee_code in self._communes:
+            self.apis[insee_code].categories = self._commune_categories(insee_code)
+        elif insee_code is not None:
+            self._forget_commune(insee_code)
+            self.data = {
+                code: data for code, data in self.data.items() if code != insee_code
+            }
+        return len(self._entries) > 0
+
+    async def async_prefetch(
+        self, insee_codes: Iterable[str], categories: Iterable[str]
+    ) -> set[str]:
+        """Fetch the data of communes in one wave, before their entries are set up
+
+        Return the INSEE codes for which data is available.
+        """
+        categories = frozenset(categories)
+        insee_codes = set(insee_codes)
+        fetched = [code for code in insee_codes if code not in self.data]
+        for insee_code in fetched:
+            if insee_code not in self.apis:
+                self.apis[insee_code] = self._create_api(insee_code, categories)
+        requests = self._requests()
+        results = await asyncio.gather(
+            *(self._async_fetch(insee_code, requests) for insee_code in fetched)
+        )
+        data = {
+            insee_code: self._compose(insee_code, result)
+            for insee_code, result in zip(fetched, results)
+            if result is not None
+        }
+        for insee_code in data:
+            self._changes[insee_code] = None
+        self.data = {**self.data, **data}
+        return {code for code in insee_codes if code in self.data}
+
+    @callback
+    def async_forget_unregistered(self) -> None:
+        """Drop the prefetched data of communes whose entry was not set up"""
+        insee_codes = self.insee_codes
+        for insee_code in [code for code in self.apis if code not in insee_codes]:
+            self._forget_commune(insee_code)
+        self.data = {
+            code: data for code, data in self.data.items() if code in insee_codes
+        }
+
+    def _forget_commune(self, insee_code: str) -> None:
+        """Drop the client and everything kept for a commune but its data
+
+        The callers drop the data, once for all the communes they forget.
+        """
+        self.apis.pop(insee_code, None)
+        self._changes.pop(insee_code, None)
+        self._aggregates.pop(insee_code, None)
+        self._summary_rows.pop(insee_code, None)
+        self._windows.pop(insee_code, None)
+        self.forecasts.pop(insee_code, None)
+        self._areas.forget(insee_code)
+
+    def _commune_categories(self, insee_code: str) -> frozenset[str]:
+        """Categories requested by all the entries of a commune"""
+        return frozenset().union(
+            *(
+                self._categories[entry_id]
+                for entry_id in self._communes.get(insee_code, ())
+            )
+        )
+
+    def has_changed(self, insee_code: str, keys: frozenset[tuple]) -> bool:
+        """Whether data of a sensor changed during the last refresh
+
+        keys are the keys of RecosanteData.diff which change the sensor.
+        """
+        changes = self._changes.get(insee_code)
+        return changes is None or not changes.isdisjoint(keys)
+
+    def category_changed(self, insee_code: str, category: str) -> bool:
+        """Whether data of a category changed during the last refresh"""
+        changes = self._changes.get(insee_code)
+        if changes is None:
             return True
-        else:
-            self.async_set_update_error(
-                f'No Data from Recosanté for INSEE code {self.config.data[CONF_INSEE_CODE]} and date {date.today().strftime("%Y-%m-%d")}'
+        return any(change[0] == category for change in changes)
+
+    def get_aggregates(self, insee_code: str) -> dict[str, tuple]:
+        """Value and attributes of the aggregate sensors of a commune
+
+        They are computed in one pass when new data arrived, and shared by
+        the aggregate sensors of every entry of the commune.
+        """
+        data = self.data.get(insee_code, EMPTY_DATA)
+        last = self._aggregates.get(insee_code)
+        if last is None or last[0] is not data:
+            last = self._aggregates[insee_code] = (data, compute_aggregates(data))
+        return last[1]
+
+    def get_forecast(self, insee_code: str, key: str) -> list[dict]:
+        """Forecasts of a sensor for the next days"""
+        forecast = self.forecasts.get(insee_code)
+        if forecast is None:
+            return []
+        return forecast.upcoming(key, dt_util.now().date())
+
+    def forecast_version(self, insee_code: str) -> int:
+        """Changes whenever a forecast of the commune changed"""
+        forecast = self.forecasts.get(insee_code)
+        return forecast.version if forecast is not None else 0
+
+    def get_summary(self, categories: Iterable[str] | None = None) -> dict:
+        """Values of every sensor of every commune, in one matrix
+
+        The row of a commune is computed once per data, and shared by every
+        request of the summary.
+        """
+        rows = {}
+        for insee_code, data in self.data.items():
+            last = self._summary_rows.get(insee_code)
+            if last is None or last[0] is not data:
+                last = self._summary_rows[insee_code] = (
+                    data,
+                    summary_row(data, self.get_aggregates(insee_code)),
+                )
+            rows[insee_code] = last[1]
+        return summary(rows, frozenset(categories or ()))
+
+    async def _async_refresh_commune(self, insee_code: str) -> None:
+        """Fetch the data of one commune, outside of the refreshes of all"""
+        result = await self._async_fetch(insee_code)
+        if result is None or insee_code not in self._communes:
+            return
+        result = self._compose(insee_code, result)
+        changes = result.diff(self.data.get(insee_code))
+        if changes == frozenset():
+            return
+        self._fire_publications(insee_code, result)
+        self._changes = {code: frozenset() for code in self.data}
+        self._changes[insee_code] = changes
+        self.data = {**self.data, insee_code: result}
+        self.async_update_listeners()
+        self._async_schedule_forecasts([insee_code])
+
+    async def _async_startup_wave(self, hass: HomeAssistant) -> None:
+        """First fetch of the communes registered while Home Assistant started"""
+        start = time.perf_counter()
+        await self.async_refresh()
+        self.stats.startup_wave = time.perf_counter() - start
+        _LOGGER.debug(
+            "Fetched %s communes after startup in %.3fs",
+            len(self.insee_codes),
+            self.stats.startup_wave,
+        )
+
+    async def async_shutdown(self) -> None:
+        """Stop refreshing once the last entry is unloaded, safe to call twice"""
+        # Only recent versions of Home Assistant shut coordinators down
+        parent_shutdown = getattr(super(), "async_shutdown", None)
+        if parent_shutdown is not None:
+            await parent_shutdown()
+        self._debounced_refresh.async_cancel()
+        if self._unsub_startup is not None:
+            self._unsub_startup()
+            self._unsub_startup = None
+        self._unschedule_refresh()
+        for task in self._pending.values():
+            task.cancel()
+        self._forecast_queue.clear()
+        if self._forecast_task is not None:
+            self._forecast_task.cancel()
+        if self._unsub_close is not None:
+            self._unsub_close()
+            self._unsub_close = None
+        await self._session.close()
+
+    async def _async_close_session(self, event: Event) -> None:
+        """Entries are not unloaded when Home Assistant stops"""
+        self._unsub_close = None
+        await self._session.close()
+
+    def async_diagnostics(self, insee_code: str | None = None) -> dict:
+        """Statistics of the refreshes, and of the last fetch of a commune"""
+        diagnostics = {
+            "communes": len(self.insee_codes),
+            "update_interval": str(self.update_interval),
+            "last_update_success": self.last_update_success,
+            "skipped_writes": self.skipped_writes,
+            "refresh": self.stats.as_dict(),
+            "breakers": {
+                host: breaker.as_dict() for host, breaker in self.breakers.items()
+            },
+            "rate_limiter": self.limiter.as_dict(),
+        }
+        if insee_code in self.stats.communes:
+            diagnostics["commune"] = self.stats.communes[insee_code].as_dict()
+        if insee_code in self.apis:
+            diagnostics["memory"] = self.memory_usage(insee_code)
+        return diagnostics
+
+    def memory_usage(self, insee_code: str, seen: set[int] | None = None) -> dict:
+        """Estimated bytes held for a commune
+
+        Objects in seen, such as the data shared with the communes already
+        counted, are skipped.
+        """
+        if seen is None:
+            seen = set()
+        api = self.apis.get(insee_code)
+        return {
+            "data_bytes": deep_sizeof(self.data.get(insee_code), seen)
+            + deep_sizeof(api.data if api is not None else None, seen),
+            "forecast_bytes": deep_sizeof(self.forecasts.get(insee_code), seen),
+            "client_bytes": instances_sizeof([api] if api is not None else [], seen),
+        }
+
+    def _create_api(self, insee_code: str, categories) -> RecosanteDataApi:
+        """Client of a commune, sharing the session, breaker, limiter and slots"""
+        if self._host not in self.breakers:
+            self.breakers[self._host] = CircuitBreaker()
+        return RecosanteDataApi(
+            {CONF_INSEE_CODE: insee_code},
+            session=self._session,
+            hass=self.hass,
+            categories=categories,
+            breaker=self.breakers[self._host],
+            limiter=self.limiter,
+            semaphore=self._semaphore,
+        )
+
+    def _requests(self) -> dict[str, frozenset[str]]:
+        """Categories requested for every commune"""
+        return {insee_code: api.categories for insee_code, api in self.apis.items()}
+
+    def _compose(self, insee_code: str, data):
+        """Data of a commune completed with the data shared by its department"""
+        return self._areas.compose(insee_code, data, self.apis[insee_code].categories)
+
+    async def _async_fetch(self, insee_code: str, requests=None):
+        """Fetch data for one commune, within the rate and concurrency limits
+
+        Department categories already fetched for another commune are not
+        requested again, the returned data has to be completed with _compose.
+        """
+        api = self.apis[insee_code]
+        omitted = self._areas.omitted(
+            insee_code, api.categories, requests or self._requests()
+        )
+        stats = FetchStats()
+        try:
+            data = await api.get_data(
+                insee_code, stats, omitted, priority=self._priority(insee_code)
+            )
+        except (RecosanteCircuitOpenError, RecosanteRateLimitedError) as err:
+            _LOGGER.debug("Not fetching INSEE code %s: %s", insee_code, err)
+            return None
+        except RecosanteApiError as err:
+            _LOGGER.warning(
+                "No Data from Recosanté for INSEE code %s and date %s: %s",
+                insee_code,
+                date.today().strftime("%Y-%m-%d"),
+                err,
             )
+            return None
+        finally:
+            self.stats.add_fetch(insee_code, stats)
+        data = self._areas.share(insee_code, data)
+        # The client keeps the shared categories instead of its own copy
+        api.share_data(data)
+        composed = self._compose(insee_code, data)
+        self._cache.async_set(insee_code, composed)
+        if composed is not self.data.get(insee_code):
+            self.hass.async_create_task(self._archive.async_add(insee_code, composed))
+        return data
+
+    def _new_windows(self, insee_code: str, data: RecosanteData) -> list[str]:
+        """Categories of a commune published with a new validity window
+
+        The windows of the data known before the first refresh of a commune
+        are the reference, nothing is new the first time it is fetched.
+        """
+        known = self._windows.get(insee_code)
+        if known is None and insee_code in self.data:
+            known = {
+                key_category: category.forecast_dates
+                for key_category, category in self.data[insee_code].categories.items()
+            }
+        windows = {
+            key_category: category.forecast_dates
+            for key_category, category in data.categories.items()
+        }
+        self._windows[insee_code] = {**(known or {}), **windows}
+        if known is None:
+            return []
+        return [
+            key_category
+            for key_category, dates in windows.items()
+            if key_category in known
+            and dates[0] is not None
+            and dates != known[key_category]
+            # Never announce older data, shared by another commune
+            and dates[0] >= (known[key_category][0] or "")
+        ]
+
+    def _fire_publications(self, insee_code: str, data: RecosanteData) -> None:
+        """Fire one event per category published with a new validity window"""
+        for key_category in self._new_windows(insee_code, data):
+            category = data.categories[key_category]
+            self.hass.bus.async_fire(
+                EVENT_PUBLICATION,
+                {
+                    CONF_INSEE_CODE: insee_code,
+                    "category": key_category,
+                    CONF_START: category.forecast_dates[0],
+                    CONF_END: category.forecast_dates[1],
+                    "data": category.to_json(),
+                },
+            )
+
+    def _priority(self, insee_code: str) -> int:
+        """Communes without valid data are fetched first"""
+        data = self.data.get(insee_code)
+        if data is None or is_stale(data.validity_ends()):
+            return PRIORITY_STALE
+        return PRIORITY_FRESH
+
+    @callback
+    def _async_schedule_forecasts(self, insee_codes: Iterable[str]) -> None:
+        """Fetch the forecasts in background, once the data is published
+
+        Communes scheduled while forecasts are fetched are fetched next.
+        """
+        self._forecast_queue.update(insee_codes)
+        if self._forecast_task is None or self._forecast_task.done():
+            self._forecast_task = self.hass.async_create_background_task(
+                self._async_update_forecasts(), f"{NAME} forecasts"
+            )
+
+    async def _async_update_forecasts(self) -> None:
+        """Fetch the queued forecasts, until none is left"""
+        while self._forecast_queue:
+            insee_codes = self._forecast_queue
+            self._forecast_queue = set()
+            await self._async_write_forecasts(insee_codes)
+
+    async def _async_write_forecasts(self, insee_codes: set[str]) -> None:
+        """Write the sensors whose forecasts changed"""
+        changed = await self._async_fetch_forecasts(insee_codes)
+        if not changed:
+            return
+        forecast_changes = frozenset(
+            (category, None, None) for category in FORECAST_CATEGORIES
+        )
+        self._changes = {
+            insee_code: forecast_changes if insee_code in changed else frozenset()
+            for insee_code in self.data
+        }
+        self.async_update_listeners()
+
+    async def _async_fetch_forecasts(self, insee_codes: Iterable[str]) -> set[str]:
+        """Fetch the forecasts not fetched today yet
+
+        Communes unregistered since they were scheduled are skipped. Return
+        the INSEE codes whose forecasts changed.
+        """
+        today = dt_util.now().date()
+        now = time.monotonic()
+        fetches = []
+        for insee_code in insee_codes:
+            if insee_code not in self.apis:
+                continue
+            categories = self.apis[insee_code].categories & set(FORECAST_CATEGORIES)
+            if not categories:
+                continue
+            forecast = self.forecasts.setdefault(insee_code, CommuneForecast())
+            for days in range(1, FORECAST_DAYS + 1):
+                day = today + timedelta(days=days)
+                if forecast.needs_fetch(day, today, now):
+                    forecast.mark_requested(day, today, now)
+                    fetches.append((insee_code, day, categories))
+        results = await asyncio.gather(
+            *(self._async_fetch_forecast(*fetch, today) for fetch in fetches)
+        )
+        return {fetch[0] for fetch, changed in zip(fetches, results) if changed}
+
+    async def _async_fetch_forecast(
+        self, insee_code: str, day: date, categories, today: date
+    ) -> bool:
+        """Fetch the forecast of a commune for a day, return whether it changed
+
+        The query changes with the day, so the client is not kept for
+        conditional requests and its data is dropped once stored.
+        """
+        api = self._create_api(insee_code, categories)
+        try:
+            data = await api.get_data(insee_code, day=day, priority=PRIORITY_FORECAST)
+        except RecosanteApiError as err:
+            _LOGGER.debug(
+                "No forecast from Recosanté for INSEE code %s and date %s: %s",
+                insee_code,
+                day.isoformat(),
+                err,
+            )
+            return False
+        if insee_code not in self.forecasts:
+            # The commune was unregistered meanwhile
             return False
+        return self.forecasts[insee_code].add(day, today, data)
 
-    async def async_unload_entry(self, hass: HomeAssistant, entry: ConfigEntry) -> bool:
-        """This method is called to clean all sensors before re-adding them"""
-        _LOGGER.debug("async_unload_entry method called")
-        unload_ok = await hass.config_entries.async_unload_platforms(
-            entry, [Platform.SENSOR]
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update all registered listeners, timing the entity fan-out"""
+        start = time.perf_counter()
+        super().async_update_listeners()
+        self.stats.fan_out = time.perf_counter() - start
+
+    async def _update_method(self):
+        # Stale communes first, the limiter also sends them by priority
+        insee_codes = sorted(self.insee_codes, key=self._priority)
+        start = time.perf_counter()
+        requests = self._requests()
+        results = await asyncio.gather(
+            *(self._async_fetch(insee_code, requests) for insee_code in insee_codes)
+        )
+        self.stats.refreshes += 1
+        self.stats.duration = time.perf_counter() - start
+        # After a failure, every sensor has to be written again
+        previous = self.data if self.last_update_success else {}
+        data = {}
+        for insee_code, result in zip(insee_codes, results):
+            if result is not None:
+                # Once every commune is fetched, department data is the latest
+                result = self._compose(insee_code, result)
+                data[insee_code] = result
+                self._changes[insee_code] = result.diff(previous.get(insee_code))
+                if self._changes[insee_code] != frozenset():
+                    self._fire_publications(insee_code, result)
+            elif insee_code in self.data:
+                # Keep the last known data for this commune
+                data[insee_code] = self.data[insee_code]
+                self._changes[insee_code] = frozenset()
+        if insee_codes and not any(result is not None for result in results):
+            # Do not come back before the breakers let a probe through, nor
+            # before the end of the pause asked by the host
+            self.update_interval = max(
+                self._scheduler.failure_interval(),
+                timedelta(
+                    seconds=max(
+                        (breaker.retry_in for breaker in self.breakers.values()),
+                        default=0,
+                    )
+                ),
+                timedelta(seconds=self.limiter.retry_in(self._host)),
+            )
+            if len(data) == len(insee_codes) and not any(
+                is_stale(commune.validity_ends()) for commune in data.values()
+            ):
+                # Data is still valid, entities remain available
+                _LOGGER.warning(
+                    "No Data from Recosanté, keeping valid data until next refresh in %s",
+                    self.update_interval,
+                )
+                return data
+            raise UpdateFailed(
+                f'No Data from Recosanté for INSEE codes {", ".join(insee_codes)} and date {date.today().strftime("%Y-%m-%d")}'
+            )
+        self.update_interval = self._scheduler.next_interval(
+            end for commune in data.values() for end in commune.validity_ends()
         )
-        if unload_ok:
-            hass.data[DOMAIN].pop(entry.entry_id)
-        return unload_ok
+        # The forecasts do not hold up the data of the day
+        self._async_schedule_forecasts(insee_codes)
+        _LOGGER.debug("Next refresh of %s data in %s", NAME, self.update_interval)
+        return data
@@ -0,0 +1,70 @@
+""" Capteurs agrégés, calculés en une passe sur les données d'une commune """
+from __future__ import annotations
+
+from .const import (
+    AGGREGATE_SENSORS,
+    NO_POLLUTION_EPISODE,
+    RecosanteAggregateEntityDescription,
+)
+from .descriptions import COMPILED_SENSORS_BY_KEY
+from .model import RecosanteData
+
+# Compiled sensors read by every aggregate sensor
+AGGREGATED = {
+    description.key: tuple(
+        COMPILED_SENSORS_BY_KEY[sensor.key] for sensor in description.sensors
+    )
+    for description in AGGREGATE_SENSORS
+}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def aggregate(
+    data: RecosanteData, description: RecosanteAggregateEntityDescription
+) -> tuple:
+    """Value and attributes of an aggregate sensor
+
+    max: highest value of the sensors, and the sensors which reach it.
+    worst: name of the sensor with the highest value.
+    active: number of sensors with a pollution episode, and their names.
+    """
+    (forecast_start, forecast_end) = data.get_forecast_dates(description.category)
+    attributes = {"forecast_start": forecast_start, "forecast_end": forecast_end}
+    values = [
+        (sensor, sensor.get_value(data)) for sensor in AGGREGATED[description.key]
+    ]
+
+    if description.aggregate == "active":
+        active = [
+            sensor.name
+            for sensor, value in values
+            if isinstance(value, str) and value != NO_POLLUTION_EPISODE
+        ]
+        known = any(value is not None for _, value in values)
+        return (len(active) if known else None), {**attributes, "sensors": active}
+
+    numbers = [(sensor, value) for sensor, value in values if _is_number(value)]
+    if not numbers:
+        return None, attributes
+    highest = max(value for _, value in numbers)
+    reached = [sensor for sensor, value in numbers if value == highest]
+    label = reached[0].get_label(data)
+    if description.aggregate == "worst":
+        return reached[0].name, {**attributes, "value": highest, "label": label}
+    return highest, {
+        **attributes,
+        "label": label,
+        "sensors": [sensor.name for sensor in reached],
+    }
+
+
+def compute_aggregates(data: RecosanteData) -> dict[str, tuple]:
+    """Value and attributes of every aggregate sensor, by sensor key"""
+    return {
+        description.key: aggregate(data, description)
+        for description in AGGREGATE_SENSORS
+        if description.category in data.categories
+    }
@@ -1,14 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import nullcontext
+from datetime import date
+import hashlib
+from http import HTTPStatus
 import logging
+import random
+import time
 import aiohttp
-from aiohttp.client import ClientTimeout, ClientError
+from aiohttp import hdrs
+from aiohttp.client import ClientTimeout, ClientError, ClientResponseError
 from homeassistant.core import HomeAssistant
-from .const import DATA_URL, API_GOUV_URL
+from yarl import URL
+from homeassistant.util.json import json_loads
+from .const import (
+    DATA_URL,
+    API_GOUV_URL,
+    DEFAULT_CATEGORIES,
+    OPTIONAL_CATEGORIES,
+    CONNECTION_LIMIT,
+    CONNECTION_LIMIT_PER_HOST,
+    DEBUG_PAYLOAD_SAMPLE_RATE,
+    DNS_CACHE_TTL,
+    KEEPALIVE_TIMEOUT,
+    SENSORS,
+)
+from .breaker import CircuitBreaker, CircuitOpenError
+from .model import RecosanteData, json_paths
+from .ratelimit import PRIORITY_FRESH, RateLimitedError, RateLimiter, parse_retry_after
+from .stats import FetchStats, create_trace_config
 
 DEFAULT_TIMEOUT = 120
 CLIENT_TIMEOUT = ClientTimeout(total=DEFAULT_TIMEOUT)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Parts of the responses read by the sensors
+JSON_PATHS = json_paths(description.json_keys for description in SENSORS)
+
+
+class RecosanteApiError(Exception):
+    """Data could not be fetched from the Recosanté API"""
+
+
+class RecosanteConnectionError(RecosanteApiError):
+    """The API could not be reached, timed out or failed"""
+
+
+class RecosanteCircuitOpenError(RecosanteApiError):
+    """The API failed too often, requests are suspended for a while"""
+
+
+class RecosanteRateLimitedError(RecosanteApiError):
+    """The API asked to slow down, requests are suspended for a while"""
+
+
+class RecosanteDataError(RecosanteApiError):
+    """The API answered with an error or an invalid response"""
+
+
+class RecosanteNoDataError(RecosanteDataError):
+    """The API has no data for the commune"""
+
+
+def create_session(timeout=CLIENT_TIMEOUT) -> aiohttp.ClientSession:
+    """Create a session with pooled keep-alive connections and cached DNS"""
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector, timeout=timeout, trace_configs=[create_trace_config()]
+    )
+
+
+def data_host() -> str:
+    """Host of the Recosanté data API"""
+    return URL(DATA_URL).host
+
+
+def build_query(categories) -> str:
+    """Query string requesting the optional categories"""
+    return "".join(
+        f"{flag}=true&"
+        for category, flag in OPTIONAL_CATEGORIES.items()
+        if category in categories
+    )
+
 
 class RecosanteDataApi:
     """API to get Recosanté data"""
@@ -19,78 +100,281 @@ class RecosanteDataApi:
         session: aiohttp.ClientSession = None,
         timeout=CLIENT_TIMEOUT,
         hass: HomeAssistant = None,
+        categories=DEFAULT_CATEGORIES,
+        breaker: CircuitBreaker | None = None,
+        limiter: RateLimiter | None = None,
+        semaphore: asyncio.Semaphore | None = None,
     ) -> None:
         self._timeout = timeout
+        # Shared by the clients of a host, suspends requests when it fails
+        self._breaker = breaker
+        # Shared by every client, spaces the requests out
+        self._limiter = limiter
+        # Shared by every client, limits the requests sent at once
+        self._semaphore = semaphore
+        self._host = URL(DATA_URL).host
+        self._categories = frozenset(categories)
+        # Only close the session when it was created here
+        self._own_session = session is None
         if session is not None:
             self._session = session
         else:
-            self._session = aiohttp.ClientSession()
+            self._session = create_session(timeout)
         self._config = config
         self._data = None
+        # Validators of the last response to self._url, for conditional requests
+        self._url = None
+        self._etag = None
+        self._last_modified = None
+        self._body_hash = None
         self._hass = hass
 
-    async def get_data(self, insee_code) -> dict:
-        """Get Data from Recosante API"""
+    async def get_data(
+        self,
+        insee_code,
+        stats: FetchStats | None = None,
+        omitted: frozenset[str] = frozenset(),
+        day: date | None = None,
+        priority: int = PRIORITY_FRESH,
+    ) -> RecosanteData:
+        """Get Data from Recosante API
+
+        Data is requested conditionally: when the server answers 304 or sends
+        the same body again, the data already parsed is returned as is.
+        Optional categories in omitted are not requested this time.
+        When a day is given, the forecast for that day is requested.
+        Requests waiting for the rate limiter are sent by priority.
+        Timings of the request are recorded in stats, the time spent waiting
+        to send it is recorded apart from its duration.
+        Raise a RecosanteApiError when no data could be fetched.
+        """
+        if stats is None:
+            stats = FetchStats()
+        start = time.perf_counter()
+        url = f"{DATA_URL}{build_query(self._categories - omitted)}insee={insee_code}"
+        if day is not None:
+            url = f"{url}&date={day.isoformat()}"
+        if url != self._url:
+            # Data and validators belong to another query
+            self._reset()
+            self._url = url
         headers = {}
-        url = f"{DATA_URL}{insee_code}"
+        if self._data is not None:
+            if self._etag is not None:
+                headers[hdrs.IF_NONE_MATCH] = self._etag
+            if self._last_modified is not None:
+                headers[hdrs.IF_MODIFIED_SINCE] = self._last_modified
         _LOGGER.debug("Getting data from %s", url)
         try:
-            result = await self._session.get(url, headers=headers)
-            json = await result.json()
-            _LOGGER.debug("Got response %s ", json)
-            _LOGGER.debug("Extracting data for INSEE %s", insee_code)
-            if len(json) > 0:  # At least one result
-                # Extract data for current day
-                self._data = json
-                _LOGGER.debug(
-                    "Extracted data for INSEE %s: %s",
-                    insee_code,
-                    self._data,
-                )
-            else:  # no result
-                self._data = None
-                _LOGGER.warning("No data for INSEE %s", insee_code)
-            return json
-        except ClientError as err:
-            return err
+            return await self._async_get_data(
+                insee_code, url, headers, stats, start, priority
+            )
+        except RecosanteApiError as err:
+            stats.error = stats.error or type(err.__cause__ or err).__name__
+            raise
+        finally:
+            stats.duration = time.perf_counter() - start - stats.queue
+
+    async def _async_get_data(
+        self,
+        insee_code,
+        url: str,
+        headers: dict,
+        stats: FetchStats,
+        start: float,
+        priority: int,
+    ) -> RecosanteData:
+        if self._limiter is not None:
+            try:
+                await self._limiter.async_acquire(self._host, priority)
+            except RateLimitedError as err:
+                raise RecosanteRateLimitedError(str(err)) from err
+        if self._breaker is not None:
+            try:
+                await self._breaker.async_acquire()
+            except CircuitOpenError as err:
+                raise RecosanteCircuitOpenError(str(err)) from err
+        try:
+            async with self._semaphore or nullcontext():
+                stats.queue = time.perf_counter() - start
+                async with self._session.get(
+                    url, headers=headers, timeout=self._timeout, trace_request_ctx=stats
+                ) as result:
+                    if (
+                        result.status >= HTTPStatus.INTERNAL_SERVER_ERROR
+                        or result.status == HTTPStatus.TOO_MANY_REQUESTS
+                    ):
+                        stats.error = f"HTTP {result.status}"
+                        retry_after = parse_retry_after(
+                            result.headers.get(hdrs.RETRY_AFTER)
+                        )
+                        if self._limiter is not None:
+                            if retry_after is not None:
+                                self._limiter.pause(self._host, retry_after)
+                            elif result.status == HTTPStatus.TOO_MANY_REQUESTS:
+                                # Slow down all the same, longer each time
+                                self._limiter.back_off(self._host)
+                        if result.status == HTTPStatus.TOO_MANY_REQUESTS:
+                            raise RecosanteRateLimitedError(
+                                f"Recosanté answered {result.status} for INSEE {insee_code}"
+                            )
+                        raise RecosanteConnectionError(
+                            f"Recosanté answered {result.status} for INSEE {insee_code}"
+                        )
+                    if (
+                        result.status == HTTPStatus.NOT_MODIFIED
+                        and self._data is not None
+                    ):
+                        self._record_success()
+                        _LOGGER.debug("Data not modified for INSEE %s", insee_code)
+                        stats.not_modified = True
+                        return self._data
+                    body = await result.read()
+                    # The host answered, whatever the answer is
+                    self._record_success()
+                    result.raise_for_status()
+                    etag = result.headers.get(hdrs.ETAG)
+                    last_modified = result.headers.get(hdrs.LAST_MODIFIED)
+        except RecosanteRateLimitedError:
+            # The host is up, it only asks to slow down
+            if self._breaker is not None:
+                self._breaker.release()
+            raise
+        except RecosanteConnectionError:
+            self._record_failure()
+            raise
+        except ClientResponseError as err:
+            raise RecosanteDataError(
+                f"Recosanté answered {err.status} for INSEE {insee_code}"
+            ) from err
+        except (ClientError, asyncio.TimeoutError) as err:
+            self._record_failure()
+            raise RecosanteConnectionError(
+                f"Cannot reach Recosanté for INSEE {insee_code}: {err!r}"
+            ) from err
+        except BaseException:
+            # Cancelled or unexpected error, a probe must not stay unresolved
+            if self._breaker is not None:
+                self._breaker.release()
+            raise
+
+        stats.payload_bytes = len(body)
+        stats.transfer = (
+            time.perf_counter() - start - stats.queue - stats.dns - stats.connect
+        )
+        # Fall back to a hash of the body when the server sends no validator
+        body_hash = hashlib.sha256(body).digest()
+        if body_hash == self._body_hash and self._data is not None:
+            _LOGGER.debug("Same data received for INSEE %s", insee_code)
+            stats.not_modified = True
+            return self._data
+        decode_start = time.perf_counter()
+        try:
+            json = json_loads(body)
+        except ValueError as err:
+            raise RecosanteDataError(
+                f"Invalid response from Recosanté for INSEE {insee_code}"
+            ) from err
+        stats.decode = time.perf_counter() - decode_start
+        _LOGGER.debug("Got %s bytes for INSEE %s", stats.payload_bytes, insee_code)
+        if (
+            _LOGGER.isEnabledFor(logging.DEBUG)
+            and random.random() < DEBUG_PAYLOAD_SAMPLE_RATE
+        ):
+            # Full payloads are only logged for a sample of the responses
+            _LOGGER.debug(
+                "Got response for INSEE %s: %s",
+                insee_code,
+                body.decode(errors="replace"),
+            )
+        # Parse and index data once for all sensors, only what they read is
+        # kept and the JSON tree is dropped
+        index_start = time.perf_counter()
+        try:
+            data = RecosanteData.from_json(json, self._categories, JSON_PATHS)
+        except (AttributeError, KeyError, TypeError, ValueError) as err:
+            raise RecosanteDataError(
+                f"Unexpected response from Recosanté for INSEE {insee_code}: {err!r}"
+            ) from err
+        stats.index = time.perf_counter() - index_start
+        if len(data) == 0:
+            self._reset()
+            raise RecosanteNoDataError(f"No data for INSEE {insee_code}")
+        self._data = data
+        self._etag = etag
+        self._last_modified = last_modified
+        self._body_hash = body_hash
+        return data
+
+    def _record_success(self) -> None:
+        if self._breaker is not None:
+            self._breaker.record_success()
+        if self._limiter is not None:
+            self._limiter.reset_backoff(self._host)
+
+    def _record_failure(self) -> None:
+        if self._breaker is not None:
+            self._breaker.record_failure()
+
+    async def close(self) -> None:
+        """Close the session if it is owned by this client"""
+        if self._own_session:
+            await self._session.close()
+
+    @property
+    def categories(self) -> frozenset[str]:
+        """Categories requested to the API"""
+        return self._categories
+
+    @categories.setter
+    def categories(self, categories) -> None:
+        categories = frozenset(categories)
+        if categories != self._categories:
+            # Data and validators belong to the previous query
+            self._categories = categories
+            self._reset()
+
+    def _reset(self) -> None:
+        self._data = None
+        self._etag = None
+        self._last_modified = None
+        self._body_hash = None
+
+    @property
+    def data(self) -> RecosanteData | None:
+        """Last data fetched"""
+        return self._data
+
+    def share_data(self, data: RecosanteData) -> None:
+        """Keep data equal to the last data fetched, sharing its categories
+
+        The parsed copy is dropped, the validators still apply to data.
+        """
+        if self._data is not None and data == self._data:
+            self._data = data
 
     def get_key(self, key_category, key_array, key):
         """Get value for the given key in JSON Data"""
-        if self._data is not None and key_category in self._data:
-            if key_array in self._data.get(key_category).get("indice"):
-                for a in self._data.get(key_category).get("indice")[key_array]:
-                    if a["label"] == key:
-                        return a.get("indice") if "indice" in a else a
-                return None
-            else:
-                return self._data.get(key_category).get("indice")
-        else:
-            return None
+        if self._data is not None:
+            return self._data.get_key(key_category, key_array, key)
+        return None
 
     def get_source(self, key_category):
         """Get value for source of data"""
-        if self._data is not None and key_category in self._data:
-            sources = [a["label"] for a in self._data.get(key_category).get("sources")]
-            return ", ".join(sources)
+        if self._data is not None:
+            return self._data.get_source(key_category)
         return None
 
     def get_forecast_dates(self, key_category):
         """Get value of data update"""
-        if self._data is not None and key_category in self._data:
-            dates = self._data.get(key_category).get("validity")
-            return (dates.get("start"), dates.get("end")) if dates else (None, None)
+        if self._data is not None:
+            return self._data.get_forecast_dates(key_category)
         return (None, None)
 
     def get_validity(self, key_category):
         """Get value of validity"""
-        if self._data is not None and key_category in self._data:
-            if "area_details" in self._data.get(key_category).get("validity"):
-                area_details = (
-                    self._data.get(key_category).get("validity").get("area_details")
-                )
-                return f"{area_details.get('type').capitalize()} {area_details.get('charniere')}{area_details.get('nom')}"
-            else:
-                return self._data.get(key_category).get("validity").get("area")
+        if self._data is not None:
+            return self._data.get_validity(key_category)
         return None
 
 
@@ -101,22 +385,31 @@ class INSEEAPI:
         self, session: aiohttp.ClientSession = None, timeout=CLIENT_TIMEOUT
     ) -> None:
         self._timeout = timeout
+        # Only close the session when it was created here
+        self._own_session = session is None
         if session is not None:
             self._session = session
         else:
-            self._session = aiohttp.ClientSession()
+            self._session = create_session(timeout)
 
     async def get_data(self, zipcode) -> dict:
         """Get INSEE code for a given zip code"""
         url = f"{API_GOUV_URL}codePostal={zipcode}&fields=s=code,nom&format=json&geometry=centre"
-        result = await self._session.get(url)
-        if result.status == 200:
-            json = await result.json()
-            _LOGGER.debug("Got response for INSEE Code %s ", json)
-            if len(json) == 0:
-                _LOGGER.error("No INSEE value fetched for %s ", zipcode)
+        async with self._session.get(url, timeout=self._timeout) as result:
+            if result.status == 200:
+                json = await result.json()
+                _LOGGER.debug("Got response for INSEE Code %s ", json)
+                if len(json) == 0:
+                    _LOGGER.error("No INSEE value fetched for %s ", zipcode)
+                    raise ValueError
+                return json
+            else:
+                _LOGGER.error(
+                    "Failed to get INSEE data, with status %s ", result.status
+                )
                 raise ValueError
-            return json
-        else:
-            _LOGGER.error("Failed to get INSEE data, with status %s ", result.status)
-            raise ValueError
+
+    async def close(self) -> None:
+        """Close the session if it is owned by this client"""
+        if self._own_session:
+            await self._session.close()
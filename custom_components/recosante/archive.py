@@ -0,0 +1,229 @@
+""" Archive quotidienne des données Recosanté, stockée par colonnes """
+from __future__ import annotations
+
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Collection, Iterable
+from datetime import date
+import json
+import logging
+import os
+import pathlib
+import sys
+import zlib
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import STORAGE_DIR
+from homeassistant.util import dt as dt_util
+
+from .const import ARCHIVE, ARCHIVE_DIR, ARCHIVE_VERSION, DOMAIN
+from .descriptions import COMPILED_SENSORS
+from .model import RecosanteData
+
+_LOGGER = logging.getLogger(__name__)
+
+# Sensor values are levels and indexes, one signed byte is enough
+MISSING = -1
+DAY_TYPECODE = "i"
+VALUE_TYPECODE = "b"
+
+
+def _to_little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, raw: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def valid_day(data: RecosanteData, key_category: str, today: date) -> date:
+    """Day the data of a category is valid for
+
+    Today when it falls in the validity window of the category, or the
+    nearest day of the window otherwise, such as the first day of yesterday's
+    data still served after midnight.
+    """
+    start, end = data.get_forecast_dates(key_category)
+    if start is not None and today.isoformat() < start[:10]:
+        return date.fromisoformat(start[:10])
+    if end is not None and today.isoformat() > end[:10]:
+        return date.fromisoformat(start[:10] if start else end[:10])
+    return today
+
+
+def sensor_values(data: RecosanteData, today: date) -> dict[date, dict[str, int]]:
+    """Value of every sensor present in the data, by valid day and sensor key"""
+    rows: dict[date, dict[str, int]] = {}
+    for sensor in COMPILED_SENSORS:
+        value = sensor.get_value(data)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            day = valid_day(data, sensor.category, today)
+            rows.setdefault(day, {})[sensor.key] = max(MISSING, min(127, round(value)))
+    return rows
+
+
+class ArchiveTable:
+    """Daily values of one commune, one array per sensor key"""
+
+    __slots__ = ("days", "columns")
+
+    def __init__(self) -> None:
+        self.days = array(DAY_TYPECODE)
+        self.columns: dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def upsert(self, day: date, values: dict[str, int]) -> bool:
+        """Set values of a day, return whether the table changed
+
+        The other values of the day are kept, a partial update does not
+        erase them.
+        """
+        ordinal = day.toordinal()
+        row = bisect_left(self.days, ordinal)
+        if row == len(self.days) or self.days[row] != ordinal:
+            self.days.insert(row, ordinal)
+            for column in self.columns.values():
+                column.insert(row, MISSING)
+        elif all(
+            key in self.columns and self.columns[key][row] == value
+            for key, value in values.items()
+        ):
+            return False
+        for key, value in values.items():
+            if key not in self.columns:
+                self.columns[key] = array(VALUE_TYPECODE, [MISSING]) * len(self.days)
+            self.columns[key][row] = value
+        return True
+
+    def query(
+        self, start: date, end: date, keys: Collection[str] | None = None
+    ) -> dict:
+        """Values of the days between start and end included"""
+        lo = bisect_left(self.days, start.toordinal())
+        hi = bisect_right(self.days, end.toordinal(), lo=lo)
+        series = {}
+        statistics = {}
+        for key, column in self.columns.items():
+            if keys and key not in keys:
+                continue
+            values = column[lo:hi]
+            series[key] = [None if value == MISSING else value for value in values]
+            known = [value for value in values if value != MISSING]
+            if known:
+                statistics[key] = {
+                    "min": min(known),
+                    "max": max(known),
+                    "mean": round(sum(known) / len(known), 2),
+                }
+        return {
+            "days": [date.fromordinal(day).isoformat() for day in self.days[lo:hi]],
+            "series": series,
+            "statistics": statistics,
+        }
+
+    def encode(self) -> bytes:
+        """A JSON header line, then the compressed columns"""
+        keys = sorted(self.columns)
+        header = {"version": ARCHIVE_VERSION, "rows": len(self.days), "keys": keys}
+        body = b"".join(
+            [_to_little_endian(self.days)]
+            + [self.columns[key].tobytes() for key in keys]
+        )
+        return json.dumps(header).encode() + b"\n" + zlib.compress(body, 9)
+
+    @classmethod
+    def decode(cls, raw: bytes) -> ArchiveTable:
+        """Read a table written by encode"""
+        header, _, body = raw.partition(b"\n")
+        header = json.loads(header)
+        if header.get("version") != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported archive version {header.get('version')}")
+        body = zlib.decompress(body)
+        rows = header["rows"]
+        table = cls()
+        size = rows * table.days.itemsize
+        table.days = _from_little_endian(DAY_TYPECODE, body[:size])
+        for key in header["keys"]:
+            table.columns[key] = array(VALUE_TYPECODE, body[size : size + rows])
+            size += rows
+        return table
+
+
+class RecosanteArchive:
+    """Archive of the daily data of every commune, one file per commune
+
+    The file of a commune is read and rewritten whenever one of its values
+    changed, one commune at a time.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._path = pathlib.Path(hass.config.path(STORAGE_DIR, ARCHIVE_DIR))
+        self._lock = asyncio.Lock()
+
+    def _file(self, insee_code: str) -> pathlib.Path:
+        return self._path / f"{insee_code}.bin"
+
+    def _load(self, insee_code: str) -> ArchiveTable:
+        try:
+            return ArchiveTable.decode(self._file(insee_code).read_bytes())
+        except FileNotFoundError:
+            return ArchiveTable()
+
+    def _add(self, insee_code: str, rows: dict[date, dict[str, int]]) -> None:
+        try:
+            table = self._load(insee_code)
+        except (ValueError, KeyError, zlib.error) as err:
+            _LOGGER.warning(
+                "Ignoring invalid archive for INSEE %s: %s", insee_code, err
+            )
+            table = ArchiveTable()
+        changed = False
+        for day, values in rows.items():
+            changed |= table.upsert(day, values)
+        if not changed:
+            return
+        self._path.mkdir(parents=True, exist_ok=True)
+        file = self._file(insee_code)
+        temporary = file.with_suffix(".tmp")
+        temporary.write_bytes(table.encode())
+        os.replace(temporary, file)
+
+    async def async_add(self, insee_code: str, data: RecosanteData) -> None:
+        """Archive the data of a commune as the data of the days it is valid for"""
+        rows = sensor_values(data, dt_util.now().date())
+        if not rows:
+            return
+        async with self._lock:
+            await self._hass.async_add_executor_job(self._add, insee_code, rows)
+
+    async def async_query(
+        self,
+        insee_code: str,
+        start: date,
+        end: date,
+        keys: Iterable[str] | None = None,
+    ) -> dict:
+        """Archived values of a commune between two days"""
+        async with self._lock:
+            table = await self._hass.async_add_executor_job(self._load, insee_code)
+        return table.query(start, end, frozenset(keys or ()))
+
+
+@callback
+def async_get_archive(hass: HomeAssistant) -> RecosanteArchive:
+    """The archive shared by the coordinator and the services"""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if ARCHIVE not in domain_data:
+        domain_data[ARCHIVE] = RecosanteArchive(hass)
+    return domain_data[ARCHIVE]
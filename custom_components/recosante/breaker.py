@@ -0,0 +1,120 @@
+""" Disjoncteur des requêtes vers un hôte en échec """
+from __future__ import annotations
+
+import asyncio
+from enum import Enum
+import time
+
+from .const import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_PROBE_TIMEOUT,
+    CIRCUIT_RECOVERY_TIMEOUT,
+)
+
+
+class CircuitOpenError(Exception):
+    """Requests to the host are suspended"""
+
+
+class CircuitState(str, Enum):
+    """State of a circuit breaker"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stop requesting a failing host, then probe it with a single request
+
+    After failure_threshold consecutive failures the circuit opens and every
+    request fails right away. Once recovery_timeout has passed, the next
+    request is sent as a probe while the others wait for its outcome: they
+    all go on together when it succeeds, and the circuit opens again when it
+    fails. A probe without outcome after probe_timeout is given up.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT,
+        probe_timeout: float = CIRCUIT_PROBE_TIMEOUT,
+    ) -> None:
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        self._probe_timeout = probe_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe: asyncio.Future | None = None
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds before a probe can be sent, 0 when requests are allowed"""
+        if self.state is not CircuitState.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self._recovery_timeout - time.monotonic())
+
+    async def async_acquire(self) -> None:
+        """Wait until a request may be sent, raise CircuitOpenError otherwise"""
+        if self.state is CircuitState.OPEN:
+            if self.retry_in > 0:
+                raise CircuitOpenError(f"Circuit open, retry in {self.retry_in:.0f}s")
+            # This request is the probe
+            self.state = CircuitState.HALF_OPEN
+            self._probe = asyncio.get_running_loop().create_future()
+            return
+        if self.state is CircuitState.HALF_OPEN and self._probe is not None:
+            probe = self._probe
+            try:
+                success = await asyncio.wait_for(
+                    asyncio.shield(probe), self._probe_timeout
+                )
+            except asyncio.TimeoutError as err:
+                if probe is self._probe:
+                    self.release()
+                raise CircuitOpenError("Circuit open, the probe did not end") from err
+            if not success:
+                raise CircuitOpenError("Circuit open, the probe failed")
+
+    def record_success(self) -> None:
+        """The host answered"""
+        self.failures = 0
+        self.state = CircuitState.CLOSED
+        self._resolve_probe(True)
+
+    def record_failure(self) -> None:
+        """The host could not be reached or failed"""
+        self.failures += 1
+        if (
+            self.state is CircuitState.HALF_OPEN
+            or self.failures >= self._failure_threshold
+        ):
+            if self.state is not CircuitState.OPEN:
+                self.opened += 1
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+            self._resolve_probe(False)
+
+    def release(self) -> None:
+        """The request ended without telling anything about the host"""
+        if self.state is CircuitState.HALF_OPEN:
+            # Let the next request probe the host instead
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic() - self._recovery_timeout
+            self._resolve_probe(False)
+
+    def _resolve_probe(self, success: bool) -> None:
+        if self._probe is not None and not self._probe.done():
+            self._probe.set_result(success)
+        self._probe = None
+
+    def as_dict(self) -> dict:
+        """State of the breaker, for diagnostics"""
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "opened": self.opened,
+            "retry_in_s": round(self.retry_in, 1),
+        }
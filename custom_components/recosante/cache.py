@@ -0,0 +1,111 @@
+""" Cache persistant des dernières données Recosanté """
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Collection
+from dataclasses import dataclass
+from datetime import datetime
+import logging
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import CACHE_SAVE_DELAY, STORAGE_KEY, STORAGE_VERSION
+from .model import RecosanteData
+from .scheduler import parse_validity_end, validity_end
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class CachedData:
+    """Data of a commune loaded from the cache"""
+
+    data: RecosanteData
+    fetched: datetime | None
+    validity_end: datetime | None
+
+    @property
+    def stale(self) -> bool:
+        """Whether the validity window of the cached data has passed"""
+        return self.validity_end is not None and self.validity_end <= dt_util.utcnow()
+
+
+class RecosanteCache:
+    """Last good payload of every commune, persisted across restarts"""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._lock = asyncio.Lock()
+        self._records: dict[str, dict] | None = None
+        # Records set before the store was loaded, merged once it is
+        self._unloaded: dict[str, dict] = {}
+
+    async def _async_load(self) -> dict[str, dict]:
+        async with self._lock:
+            if self._records is None:
+                self._records = await self._store.async_load() or {}
+                if self._unloaded:
+                    self._records.update(self._unloaded)
+                    self._unloaded.clear()
+                    self._store.async_delay_save(self._data_to_save, CACHE_SAVE_DELAY)
+        return self._records
+
+    async def async_get(
+        self, insee_code: str, categories: Collection[str] | None = None
+    ) -> CachedData | None:
+        """Get the cached data of a commune, restricted to the given categories"""
+        record = (await self._async_load()).get(insee_code)
+        if record is None:
+            return None
+        payload = record["payload"]
+        if isinstance(payload, RecosanteData):
+            payload = payload.to_json()
+        try:
+            return CachedData(
+                data=RecosanteData.from_json(payload, categories),
+                fetched=dt_util.parse_datetime(record["fetched"]),
+                validity_end=parse_validity_end(record["validity_end"]),
+            )
+        except (KeyError, TypeError, AttributeError) as err:
+            _LOGGER.warning("Ignoring invalid cache for INSEE %s: %s", insee_code, err)
+            return None
+
+    @callback
+    def async_set(self, insee_code: str, data: RecosanteData) -> None:
+        """Cache the data of a commune, saved after a delay
+
+        The parsed data is kept as is, it is only turned into JSON when saved.
+        """
+        end = validity_end(data.validity_ends())
+        record = {
+            "fetched": dt_util.utcnow().isoformat(),
+            "validity_end": end.isoformat() if end else None,
+            "payload": data,
+        }
+        if self._records is None:
+            # Saved along with the stored records once they are loaded
+            if not self._unloaded:
+                self._hass.async_create_task(self._async_load())
+            self._unloaded[insee_code] = record
+            return
+        self._records[insee_code] = record
+        self._store.async_delay_save(self._data_to_save, CACHE_SAVE_DELAY)
+
+    def _data_to_save(self) -> dict[str, dict]:
+        return {
+            insee_code: (
+                {**record, "payload": record["payload"].to_json()}
+                if isinstance(record["payload"], RecosanteData)
+                else record
+            )
+            for insee_code, record in (self._records or {}).items()
+        }
+
+    async def async_remove(self, insee_code: str) -> None:
+        """Remove a commune from the cache"""
+        records = await self._async_load()
+        if records.pop(insee_code, None) is not None:
+            await self._store.async_save(self._data_to_save())
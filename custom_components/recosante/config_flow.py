@@ -5,8 +5,17 @@ from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant import config_entries
 from homeassistant.core import HomeAssistant
 from homeassistant.core import callback
-from .const import DOMAIN, TITLE, CONF_INSEE_CODE, CONF_CITY
+from .const import (
+    DOMAIN,
+    TITLE,
+    CATEGORIES,
+    CONF_CATEGORIES,
+    CONF_INSEE_CODE,
+    CONF_CITY,
+    DEFAULT_CATEGORIES,
+)
 from .api import INSEEAPI
+from .insee_index import get_insee_index
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -14,7 +23,10 @@ ZIPCODE_SCHEMA = vol.Schema({vol.Required("zip_code", default=""): cv.string})
 
 
 async def get_insee_code(hass: HomeAssistant, data: dict) -> None:
-    """Get Insee code from zip code"""
+    """Get Insee code from zip code, from the local index or online"""
+    index = await hass.async_add_executor_job(get_insee_index)
+    if communes := index.lookup(data):
+        return communes
     session = async_get_clientsession(hass)
     try:
         client = INSEEAPI(session)
@@ -36,6 +48,12 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         self._init_info = {}
         self.city_insee = []
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Get the options flow for this handler"""
+        return OptionsFlowHandler(config_entry)
+
     @callback
     def _show_setup_form(self, step_id=None, user_input=None, schema=None, errors=None):
         """Show the setup form to the user."""
@@ -78,6 +96,18 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             )
         return self._show_setup_form("location", None, ZIPCODE_SCHEMA, errors)
 
+    async def async_step_import(self, import_info):
+        """Create an entry for a commune already resolved by the add_communes service"""
+        insee_code = import_info[CONF_INSEE_CODE]
+        for entry in self._async_current_entries():
+            if entry.data.get(CONF_INSEE_CODE) == insee_code:
+                return self.async_abort(reason="already_configured")
+        return self.async_create_entry(
+            title=f"{TITLE} - {import_info[CONF_CITY]}",
+            data={CONF_INSEE_CODE: insee_code, CONF_CITY: import_info[CONF_CITY]},
+            options={CONF_CATEGORIES: import_info[CONF_CATEGORIES]},
+        )
+
     async def async_step_multilocation(self, user_input=None):
         """Handle location step"""
         errors = {}
@@ -104,3 +134,32 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         self.data[CONF_INSEE_CODE] = city_infos[0]
         self.data[CONF_CITY] = city_infos[1]
         return await self.async_step_location(self.data)
+
+
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle options of a Recosanté entry."""
+
+    def __init__(self, config_entry):
+        """Initialize"""
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        """Select the categories of data to fetch"""
+        errors = {}
+        if user_input is not None:
+            if user_input[CONF_CATEGORIES]:
+                return self.async_create_entry(title="", data=user_input)
+            errors["base"] = "nocategory"
+
+        categories = self.config_entry.options.get(CONF_CATEGORIES, DEFAULT_CATEGORIES)
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(CONF_CATEGORIES, default=categories): cv.multi_select(
+                        CATEGORIES
+                    ),
+                }
+            ),
+            errors=errors,
+        )
@@ -8,12 +8,17 @@ from homeassistant.components.sensor import (
 from homeassistant.const import (
     Platform,
     UV_INDEX,
+    EntityCategory,
+    UnitOfInformation,
+    UnitOfTime,
 )
 
 
 DOMAIN = "recosante"
 COORDINATOR = "coordinator"
 UNDO_LISTENER = "undo_listener"
+CACHE = "cache"
+ARCHIVE = "archive"
 NAME = "Recosanté"
 
 # List of platforms to support. There should be a matching .py file for each,
@@ -21,15 +26,86 @@ NAME = "Recosanté"
 PLATFORMS: list[Platform] = [Platform.SENSOR]
 CLIENT_TIMEOUT = 10
 BASE_URL = "https://api.recosante.beta.gouv.fr"
-DATA_URL = f"{BASE_URL}/v1/?show_raep=true&show_indice_uv=true&insee="
+DATA_URL = f"{BASE_URL}/v1/?"
 API_GOUV_URL = "https://geo.api.gouv.fr/communes?"
 
 ATTRIBUTION = "Recosanté"
 MODEL = "Recosanté API"
 CONF_INSEE_CODE = "INSEE"
 CONF_CITY = "city"
+CONF_CATEGORIES = "categories"
+CONF_ZIP_CODES = "zip_codes"
+CONF_INSEE_CODES = "insee_codes"
+SERVICE_ADD_COMMUNES = "add_communes"
+SERVICE_GET_HISTORY = "get_history"
+EVENT_HISTORY = f"{DOMAIN}_history"
+EVENT_PUBLICATION = f"{DOMAIN}_publication"
+WS_TYPE_SUMMARY = f"{DOMAIN}/summary"
+CONF_START = "start"
+CONF_END = "end"
+CONF_KEYS = "keys"
 TITLE = "Recosanté"
 REFRESH_INTERVAL = 60
+# Adaptive refresh, in minutes
+MIN_REFRESH_INTERVAL = 5
+MAX_REFRESH_INTERVAL = 24 * 60
+PUBLICATION_REFRESH_INTERVAL = 15
+PUBLICATION_WINDOW = 12 * 60
+BACKOFF_MIN_INTERVAL = 1
+BACKOFF_MAX_INTERVAL = 60
+MAX_CONCURRENT_REQUESTS = 4
+# Circuit breaker: consecutive failures before suspending the requests to a
+# host, delay in seconds before probing it again, and longest wait in seconds
+# for the outcome of a probe
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RECOVERY_TIMEOUT = 300
+CIRCUIT_PROBE_TIMEOUT = 2 * CLIENT_TIMEOUT
+# Rate limit shared by every client, in requests per second and burst size,
+# for all hosts and per host. Longest Retry-After honoured, longest pause
+# a request waits for instead of failing, and first pause after a 429
+# without Retry-After, doubled on each new one, in seconds
+RATE_LIMIT_RATE = 20
+RATE_LIMIT_BURST = 40
+RATE_LIMIT_HOST_RATE = 10
+RATE_LIMIT_HOST_BURST = 20
+RATE_LIMIT_MAX_RETRY_AFTER = 3600
+RATE_LIMIT_MAX_WAIT = 10
+RATE_LIMIT_BACKOFF = 5
+# HTTP connection pool
+CONNECTION_LIMIT = 20
+CONNECTION_LIMIT_PER_HOST = MAX_CONCURRENT_REQUESTS
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+# Share of the responses whose full payload is logged in debug mode
+DEBUG_PAYLOAD_SAMPLE_RATE = 0.01
+STORAGE_KEY = f"{DOMAIN}.cache"
+STORAGE_VERSION = 1
+# Delay before writing the cache to disk, in seconds
+CACHE_SAVE_DELAY = 60
+ARCHIVE_DIR = f"{DOMAIN}_archive"
+ARCHIVE_VERSION = 1
+
+CATEGORIES = {
+    "indice_atmo": "Indice ATMO de la qualité de l'air",
+    "vigilance_meteo": "Vigilance Météo",
+    "episodes_pollution": "Épisodes de pollution",
+    "potentiel_radon": "Potentiel Radon",
+    "raep": "Risque d'allergie aux pollens",
+    "indice_uv": "Indice UV",
+}
+DEFAULT_CATEGORIES = list(CATEGORIES)
+# Categories only returned by the API when requested, with their query flag
+OPTIONAL_CATEGORIES = {
+    "raep": "show_raep",
+    "indice_uv": "show_indice_uv",
+}
+# Categories forecast by the API for the next days, how many days, and
+# minutes between two requests of a day not published yet
+FORECAST_CATEGORIES = ("indice_atmo", "indice_uv")
+FORECAST_DAYS = 2
+FORECAST_RETRY_INTERVAL = 60
+# Types of validity area shared by all the communes of a department
+DEPARTMENT_AREA_TYPES = ("departement", "département")
 
 ICON_ALERT = "mdi:alert-decagram"
 ICON_GAS = "mdi:molecule"
@@ -37,6 +113,9 @@ ICON_GRASS = "mdi:grass"
 ICON_PARTICULATE = "mdi:blur"
 ICON_TREE = "mdi:tree"
 
+# Level of a pollutant without pollution episode
+NO_POLLUTION_EPISODE = "Pas de dépassement"
+
 
 @dataclass
 class JSONKeys:
@@ -330,3 +409,90 @@ UV_SENSORS: tuple[RecosanteSensorEntityDescription, ...] = (
         json_keys=JSONKeys(category="indice_uv", array=None, label=None),
     ),
 )
+
+SENSORS: tuple[RecosanteSensorEntityDescription, ...] = (
+    ATMO_SENSORS
+    + METEO_SENSORS
+    + POLLUTION_SENSORS
+    + RADON_SENSORS
+    + RAEP_SENSORS
+    + UV_SENSORS
+)
+
+
+@dataclass
+class RecosanteAggregateRequiredKeysMixin:
+    """Mixin for required keys."""
+
+    category: str
+    aggregate: str
+    sensors: tuple[RecosanteSensorEntityDescription, ...]
+
+
+@dataclass
+class RecosanteAggregateEntityDescription(
+    SensorEntityDescription, RecosanteAggregateRequiredKeysMixin
+):
+    """Describes a Recosanté sensor computed from the sensors of a category."""
+
+
+AGGREGATE_SENSORS: tuple[RecosanteAggregateEntityDescription, ...] = (
+    RecosanteAggregateEntityDescription(
+        key="pollen_max",
+        name="Risque maximal d'allergie aux pollens",
+        device_class=SensorDeviceClass.AQI,
+        icon=ICON_TREE,
+        state_class=SensorStateClass.MEASUREMENT,
+        category="raep",
+        aggregate="max",
+        sensors=tuple(
+            description
+            for description in RAEP_SENSORS
+            if description.json_keys.array is not None
+        ),
+    ),
+    RecosanteAggregateEntityDescription(
+        key="atmo_worst",
+        name="Polluant le plus élevé",
+        icon=ICON_GAS,
+        category="indice_atmo",
+        aggregate="worst",
+        sensors=tuple(
+            description
+            for description in ATMO_SENSORS
+            if description.json_keys.array is not None
+        ),
+    ),
+    RecosanteAggregateEntityDescription(
+        key="ep_active",
+        name="Épisodes de pollution en cours",
+        icon=ICON_ALERT,
+        state_class=SensorStateClass.MEASUREMENT,
+        category="episodes_pollution",
+        aggregate="active",
+        sensors=POLLUTION_SENSORS,
+    ),
+)
+
+DIAGNOSTIC_SENSORS: tuple[SensorEntityDescription, ...] = (
+    SensorEntityDescription(
+        key="duration_ms",
+        name="Durée de mise à jour",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        icon="mdi:timer-outline",
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+    ),
+    SensorEntityDescription(
+        key="payload_bytes",
+        name="Taille des données",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        icon="mdi:download-network",
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+    ),
+)
@@ -0,0 +1,112 @@
+""" Table des capteurs, compilée une fois à l'import à partir des descriptions """
+from __future__ import annotations
+
+from collections.abc import Collection
+from dataclasses import dataclass
+from functools import lru_cache
+
+from homeassistant.config_entries import ConfigEntry
+
+from .const import (
+    CONF_CITY,
+    CONF_INSEE_CODE,
+    FORECAST_CATEGORIES,
+    SENSORS,
+    RecosanteSensorEntityDescription,
+)
+from .model import RecosanteData
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledSensor:
+    """A sensor description, with everything derived from its JSON keys"""
+
+    description: RecosanteSensorEntityDescription
+    key: str
+    name: str
+    category: str
+    path: tuple[str | None, str | None]
+    # Keys of RecosanteData.diff which change the value of the sensor
+    changes: frozenset[tuple]
+    forecast: bool
+
+    @classmethod
+    def compile(cls, description: RecosanteSensorEntityDescription) -> CompiledSensor:
+        """Resolve the JSON keys of a description once"""
+        json_keys = description.json_keys
+        return cls(
+            description=description,
+            key=description.key,
+            name=description.name,
+            category=json_keys.category,
+            path=(json_keys.array, json_keys.label),
+            changes=frozenset(
+                {
+                    (json_keys.category, None, None),
+                    (json_keys.category, json_keys.array, json_keys.label),
+                }
+            ),
+            forecast=json_keys.category in FORECAST_CATEGORIES,
+        )
+
+    def get_value(self, data: RecosanteData):
+        """Value or level of the sensor"""
+        return data.get_value(self.category, *self.path)
+
+    def get_label(self, data: RecosanteData):
+        """Label of the sensor"""
+        return data.get_label(self.category, *self.path)
+
+    def get_state(self, data: RecosanteData) -> tuple:
+        """Value and attributes of the sensor, reading its category once"""
+        category = data.categories.get(self.category)
+        if category is None:
+            return None, {
+                "forecast_start": None,
+                "forecast_end": None,
+                "label": None,
+                "area_validity": None,
+            }
+        return category.get_value(*self.path), {
+            "forecast_start": category.forecast_dates[0],
+            "forecast_end": category.forecast_dates[1],
+            "label": category.get_label(*self.path),
+            "area_validity": category.validity,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class EntryNames:
+    """Parts of the names and IDs shared by the sensors of an entry"""
+
+    insee_code: str
+    name_suffix: str
+    unique_id_prefix: str
+
+    @classmethod
+    def from_entry(cls, entry: ConfigEntry) -> EntryNames:
+        """Format the parts of an entry once for all its sensors"""
+        insee_code = entry.data.get(CONF_INSEE_CODE)
+        return cls(
+            insee_code=insee_code,
+            name_suffix=f" - {entry.data.get(CONF_CITY)}",
+            unique_id_prefix=f"{entry.entry_id} - {insee_code} - ",
+        )
+
+
+COMPILED_SENSORS: tuple[CompiledSensor, ...] = tuple(
+    CompiledSensor.compile(description) for description in SENSORS
+)
+COMPILED_SENSORS_BY_KEY: dict[str, CompiledSensor] = {
+    sensor.key: sensor for sensor in COMPILED_SENSORS
+}
+
+
+@lru_cache(maxsize=None)
+def _sensors_of(categories: frozenset[str]) -> tuple[CompiledSensor, ...]:
+    return tuple(sensor for sensor in COMPILED_SENSORS if sensor.category in categories)
+
+
+def sensors_of(categories: Collection[str]) -> tuple[CompiledSensor, ...]:
+    """Sensors of the given categories, computed once per set of categories"""
+    return _sensors_of(frozenset(categories))
@@ -0,0 +1,32 @@
+""" Diagnostics de l'intégration Recosanté """
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import async_get_platforms
+
+from .const import DOMAIN, COORDINATOR, CONF_INSEE_CODE
+from .memory import instances_sizeof
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict:
+    """Diagnostics of a config entry"""
+    coordinator = hass.data[DOMAIN][entry.entry_id][COORDINATOR]
+    diagnostics = coordinator.async_diagnostics(entry.data.get(CONF_INSEE_CODE))
+    entities = [
+        entity
+        for platform in async_get_platforms(hass, DOMAIN)
+        if platform.config_entry is entry
+        for entity in platform.entities.values()
+    ]
+    diagnostics.setdefault("memory", {}).update(
+        entities=len(entities), entity_bytes=instances_sizeof(entities)
+    )
+    return {
+        "entry": {
+            "title": entry.title,
+            "data": dict(entry.data),
+            "options": dict(entry.options),
+        },
+        "coordinator": diagnostics,
+    }
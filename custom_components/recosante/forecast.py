@@ -0,0 +1,135 @@
+""" Prévisions des jours suivants, dans un tampon circulaire par capteur """
+from __future__ import annotations
+
+from array import array
+from datetime import date
+import math
+from typing import Any
+
+from .const import FORECAST_DAYS, FORECAST_RETRY_INTERVAL
+from .descriptions import COMPILED_SENSORS
+from .model import RecosanteData
+
+# Today and every forecast day have their own slot
+FORECAST_BUFFER_SIZE = FORECAST_DAYS + 1
+
+FORECAST_SENSORS = tuple(sensor for sensor in COMPILED_SENSORS if sensor.forecast)
+
+
+def forecast_day(data: RecosanteData, key_category: str) -> str | None:
+    """Day the data of a category is valid for, as an ISO date"""
+    start = data.get_forecast_dates(key_category)[0]
+    return start[:10] if start else None
+
+
+class ForecastRing:
+    """Forecasts of one sensor, one slot per day in a fixed-size ring
+
+    The slot of a day is its ordinal modulo the size of the ring, so the
+    forecast of a new day replaces the one of a past day.
+    """
+
+    __slots__ = ("days", "values", "labels")
+
+    def __init__(self, size: int = FORECAST_BUFFER_SIZE) -> None:
+        self.days = array("i", [0]) * size
+        self.values: list[Any] = [None] * size
+        self.labels: list[Any] = [None] * size
+
+    def set(self, day: date, value, label) -> bool:
+        """Store the forecast of a day, return whether it changed"""
+        ordinal = day.toordinal()
+        slot = ordinal % len(self.days)
+        if (
+            self.days[slot] == ordinal
+            and self.values[slot] == value
+            and self.labels[slot] == label
+        ):
+            return False
+        self.days[slot] = ordinal
+        self.values[slot] = value
+        self.labels[slot] = label
+        return True
+
+    def upcoming(self, today: date) -> list[dict]:
+        """Forecasts of the days after today, in chronological order"""
+        start = today.toordinal()
+        return [
+            {
+                "date": date.fromordinal(day).isoformat(),
+                "value": self.values[slot],
+                "label": self.labels[slot],
+            }
+            for day, slot in sorted(
+                (day, slot) for slot, day in enumerate(self.days) if day > start
+            )
+        ]
+
+
+class CommuneForecast:
+    """Forecasts of the sensors of a commune, and the day each one was fetched"""
+
+    __slots__ = ("rings", "fetched", "requested", "version")
+
+    def __init__(self) -> None:
+        self.rings: dict[str, ForecastRing] = {}
+        # Day each forecast day was last fetched, by day ordinal
+        self.fetched: dict[int, int] = {}
+        # Monotonic time each forecast day was last requested, by day ordinal
+        self.requested: dict[int, float] = {}
+        # Incremented whenever a forecast changed
+        self.version = 0
+
+    def needs_fetch(self, day: date, today: date, now: float) -> bool:
+        """Whether the forecast of a day was not fetched today yet
+
+        A day not published yet is requested again at most every
+        FORECAST_RETRY_INTERVAL minutes.
+        """
+        ordinal = day.toordinal()
+        return (
+            self.fetched.get(ordinal) != today.toordinal()
+            and now - self.requested.get(ordinal, -math.inf)
+            >= FORECAST_RETRY_INTERVAL * 60
+        )
+
+    def mark_requested(self, day: date, today: date, now: float) -> None:
+        """Remember when the forecast of a day was requested"""
+        self.requested = {
+            ordinal: requested
+            for ordinal, requested in self.requested.items()
+            if ordinal > today.toordinal()
+        }
+        self.requested[day.toordinal()] = now
+
+    def add(self, day: date, today: date, data: RecosanteData) -> bool:
+        """Store the forecast of a day, return whether a value changed
+
+        Categories which are not valid for that day, because the API has
+        no forecast for them, are ignored. The day is only marked as fetched
+        when a forecast was stored, so that it is requested again on the
+        next refreshes until the API publishes it.
+        """
+        self.fetched = {
+            ordinal: fetched
+            for ordinal, fetched in self.fetched.items()
+            if ordinal > today.toordinal()
+        }
+        changed = False
+        iso_day = day.isoformat()
+        for sensor in FORECAST_SENSORS:
+            if forecast_day(data, sensor.category) != iso_day:
+                continue
+            self.fetched[day.toordinal()] = today.toordinal()
+            ring = self.rings.get(sensor.key)
+            if ring is None:
+                ring = self.rings[sensor.key] = ForecastRing()
+            changed |= ring.set(day, sensor.get_value(data), sensor.get_label(data))
+        if changed:
+            self.version += 1
+        return changed
+
+    def upcoming(self, key: str, today: date) -> list[dict]:
+        """Forecasts of a sensor for the days after today"""
+        ring = self.rings.get(key)
+        return ring.upcoming(today) if ring is not None else []
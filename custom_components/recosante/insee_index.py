@@ -0,0 +1,100 @@
+""" Index local des codes postaux vers les codes INSEE """
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable
+import csv
+import gzip
+import io
+import logging
+import pathlib
+
+_LOGGER = logging.getLogger(__name__)
+
+INDEX_PATH = pathlib.Path(__file__).parent / "data" / "communes.csv.gz"
+GEO_COMMUNES_URL = (
+    "https://geo.api.gouv.fr/communes?fields=nom,code,codesPostaux&format=json"
+)
+
+
+class InseeIndex:
+    """Communes by postal code, sorted for binary search"""
+
+    __slots__ = ("_postal_codes", "_insee_codes", "_names", "_names_by_code")
+
+    def __init__(self, rows: Iterable[tuple[str, str, str]] = ()) -> None:
+        rows = sorted(set(rows))
+        self._postal_codes = array("I", (int(row[0]) for row in rows))
+        self._insee_codes = [row[1] for row in rows]
+        self._names = [row[2] for row in rows]
+        self._names_by_code = dict(zip(self._insee_codes, self._names))
+
+    def __len__(self) -> int:
+        return len(self._postal_codes)
+
+    def lookup(self, zipcode: str) -> list[dict]:
+        """Communes of a postal code, in the format of geo.api.gouv.fr"""
+        zipcode = str(zipcode).strip()
+        if len(zipcode) != 5 or not zipcode.isdigit():
+            return []
+        key = int(zipcode)
+        start = bisect_left(self._postal_codes, key)
+        end = bisect_right(self._postal_codes, key, lo=start)
+        return [
+            {"code": self._insee_codes[i], "nom": self._names[i]}
+            for i in range(start, end)
+        ]
+
+    def name(self, insee_code: str) -> str | None:
+        """Name of the commune of an INSEE code"""
+        return self._names_by_code.get(str(insee_code).strip())
+
+    @classmethod
+    def from_communes(cls, communes: list[dict]) -> InseeIndex:
+        """Build the index from the communes listed by geo.api.gouv.fr"""
+        return cls(
+            (postal_code, commune["code"], commune["nom"])
+            for commune in communes
+            for postal_code in commune.get("codesPostaux", [])
+        )
+
+    @classmethod
+    def load(cls, path: pathlib.Path = INDEX_PATH) -> InseeIndex:
+        """Load the index from a gzipped CSV file, empty if it does not exist"""
+        try:
+            with gzip.open(path, "rt", encoding="utf-8", newline="") as file:
+                return cls(tuple(row) for row in csv.reader(file, delimiter=";"))
+        except FileNotFoundError:
+            _LOGGER.debug("No INSEE index at %s", path)
+            return cls()
+
+    def save(self, path: pathlib.Path = INDEX_PATH) -> None:
+        """Save the index as a gzipped CSV file"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=";", lineterminator="\n")
+        for postal_code, insee_code, name in zip(
+            self._postal_codes, self._insee_codes, self._names
+        ):
+            writer.writerow((f"{postal_code:05d}", insee_code, name))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # mtime=0 keeps the file identical when the data did not change
+        with open(path, "wb") as file, gzip.GzipFile(
+            fileobj=file, mode="wb", mtime=0
+        ) as gzip_file:
+            gzip_file.write(buffer.getvalue().encode("utf-8"))
+
+
+_INDEX: InseeIndex | None = None
+
+
+def get_insee_index() -> InseeIndex:
+    """The bundled index, loaded once it exists (blocking I/O)"""
+    global _INDEX  # pylint: disable=global-statement
+    if _INDEX is not None:
+        return _INDEX
+    index = InseeIndex.load()
+    if len(index) > 0:
+        # A missing index is looked for again, it may be generated meanwhile
+        _INDEX = index
+    return index
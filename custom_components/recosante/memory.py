@@ -0,0 +1,64 @@
+""" Estimation de la mémoire occupée par les données et les capteurs """
+from __future__ import annotations
+
+from collections.abc import Iterable
+import dataclasses
+import sys
+from types import MappingProxyType
+from typing import Any
+
+# Values whose size does not depend on what they hold
+_SCALARS = (str, bytes, int, float, bool, type(None))
+
+
+def deep_sizeof(obj: Any, seen: set[int] | None = None) -> int:
+    """Bytes of an object and of the containers and dataclasses it holds
+
+    Every object is counted once, objects already in seen are skipped. Other
+    objects, such as clients or Home Assistant objects, are counted without
+    what they reference.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, _SCALARS):
+        return size
+    if isinstance(obj, MappingProxyType):
+        # The proxy does not expose its mapping, count an equivalent dict
+        size += sys.getsizeof(dict(obj))
+        children: Iterable = (item for pair in obj.items() for item in pair)
+    elif isinstance(obj, dict):
+        children = (item for pair in obj.items() for item in pair)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = obj
+    elif dataclasses.is_dataclass(obj):
+        children = (getattr(obj, field.name) for field in dataclasses.fields(obj))
+    elif hasattr(obj, "__slots__"):
+        children = (getattr(obj, name) for name in obj.__slots__ if hasattr(obj, name))
+    else:
+        return size
+    return size + sum(deep_sizeof(child, seen) for child in children)
+
+
+def instances_sizeof(instances: Iterable, seen: set[int] | None = None) -> int:
+    """Bytes of objects and of the plain values in their attributes
+
+    What else they reference, such as the coordinator, the descriptions or
+    the data read by entities, is shared and not counted.
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    for instance in instances:
+        seen.add(id(instance))
+        attributes = vars(instance)
+        size += sys.getsizeof(instance) + sys.getsizeof(attributes)
+        size += sum(
+            deep_sizeof(value, seen)
+            for value in attributes.values()
+            if isinstance(value, (*_SCALARS, dict, list, tuple, set, frozenset))
+        )
+    return size
@@ -0,0 +1,353 @@
+""" Modèle indexé des données Recosanté """
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+import sys
+from types import MappingProxyType
+from typing import Any, Collection, Iterable, Mapping, NamedTuple
+
+# Fields of a validity window kept from the responses
+VALIDITY_FIELDS = ("start", "end", "area", "area_details")
+# Distinct indices and entry keys shared by the data of every commune
+SHARED_CACHE_SIZE = 4096
+
+
+def intern(value):
+    """The copy of a string shared by every response, other values as is"""
+    return sys.intern(value) if type(value) is str else value
+
+
+class RecosanteIndice(NamedTuple):
+    """The fields of an index read by the sensors, the others are dropped"""
+
+    value: Any = None
+    level: Any = None
+    label: Any = None
+
+    @classmethod
+    def from_json(cls, json):
+        """Compact an index of the JSON response, other values are kept as is
+
+        Equal indices of every response share the same object.
+        """
+        if not isinstance(json, dict):
+            return intern(json)
+        fields = (
+            intern(json.get("value")),
+            intern(json.get("level")),
+            intern(json.get("label")),
+        )
+        try:
+            return _shared_indice(*fields)
+        except TypeError:
+            # Values which cannot be hashed are not shared
+            return cls(*fields)
+
+    def to_json(self) -> dict:
+        """The index as returned by the API, without the dropped fields"""
+        return {
+            key: value for key, value in self._asdict().items() if value is not None
+        }
+
+
+@lru_cache(maxsize=SHARED_CACHE_SIZE, typed=True)
+def _shared_indice(value, level, label) -> RecosanteIndice:
+    return RecosanteIndice(value, level, label)
+
+
+@lru_cache(maxsize=SHARED_CACHE_SIZE, typed=True)
+def _shared_key(key_array: str, label) -> tuple[str, Any]:
+    return (key_array, label)
+
+
+def json_paths(json_keys: Iterable) -> dict[str, dict[str, frozenset]]:
+    """Labels read by the sensors, by array and by category"""
+    paths: dict[str, dict[str, frozenset]] = {}
+    for keys in json_keys:
+        arrays = paths.setdefault(keys.category, {})
+        if keys.array is not None:
+            arrays[keys.array] = arrays.get(keys.array, frozenset()) | {keys.label}
+    return paths
+
+
+def _intern_json(value):
+    """Strings of a JSON value shared by every response"""
+    if isinstance(value, dict):
+        return {intern(key): _intern_json(item) for key, item in value.items()}
+    return intern(value)
+
+
+@dataclass(frozen=True, slots=True)
+class RecosanteCategory:
+    """Parsed data of one category (indice_atmo, raep...) of a response"""
+
+    indice: RecosanteIndice | Any
+    arrays: frozenset[str]
+    entries: Mapping[tuple[str, str], RecosanteIndice | Any]
+    source: str | None
+    forecast_dates: tuple[str | None, str | None]
+    validity: str | None
+    area_type: str | None
+    validity_json: Mapping[str, Any] | None
+
+    @classmethod
+    def from_json(
+        cls, json: dict, paths: Mapping[str, frozenset] | None = None
+    ) -> RecosanteCategory:
+        """Index a category of the JSON response
+
+        When paths are given, only the arrays and labels they list are kept.
+        """
+        indice = json.get("indice")
+        arrays = set()
+        entries = {}
+        if isinstance(indice, dict):
+            for key_array, array in indice.items():
+                if not isinstance(array, list):
+                    continue
+                if paths is not None and key_array not in paths:
+                    continue
+                # The array is kept, even empty, so that lookups behave the same
+                arrays.add(key_array)
+                labels = paths[key_array] if paths is not None else None
+                key_array = intern(key_array)
+                for a in array:
+                    if not isinstance(a, dict):
+                        continue
+                    label = a.get("label")
+                    if labels is not None and label not in labels:
+                        continue
+                    try:
+                        key = _shared_key(key_array, intern(label))
+                    except TypeError:
+                        key = (key_array, label)
+                    # Keep the first occurrence of a label, as a linear scan would
+                    if key not in entries:
+                        entries[key] = RecosanteIndice.from_json(
+                            a.get("indice") if "indice" in a else a
+                        )
+
+        sources = json.get("sources")
+        source_labels = (
+            [
+                str(a["label"])
+                for a in sources
+                if isinstance(a, dict) and a.get("label") is not None
+            ]
+            if isinstance(sources, list)
+            else []
+        )
+        source = intern(", ".join(source_labels)) if source_labels else None
+
+        dates = json.get("validity")
+        if not isinstance(dates, dict):
+            dates = None
+        forecast_dates = (
+            (intern(dates.get("start")), intern(dates.get("end")))
+            if dates
+            else (None, None)
+        )
+
+        validity = None
+        area_type = None
+        if dates:
+            area_details = dates.get("area_details")
+            if isinstance(area_details, dict) and isinstance(
+                area_details.get("type"), str
+            ):
+                area_type = intern(area_details.get("type"))
+                validity = intern(
+                    f"{area_details.get('type').capitalize()} {area_details.get('charniere')}{area_details.get('nom')}"
+                )
+            else:
+                validity = intern(dates.get("area"))
+
+        return cls(
+            indice=RecosanteIndice.from_json(indice),
+            arrays=frozenset(arrays),
+            entries=MappingProxyType(entries),
+            source=source,
+            forecast_dates=forecast_dates,
+            validity=validity,
+            area_type=area_type,
+            validity_json=(
+                {
+                    key: _intern_json(dates[key])
+                    for key in VALIDITY_FIELDS
+                    if key in dates
+                }
+                if dates
+                else None
+            ),
+        )
+
+    def to_json(self) -> dict:
+        """The category as returned by the API, without the dropped fields"""
+        indice = self.indice
+        if isinstance(indice, RecosanteIndice):
+            indice = indice.to_json()
+            for key_array in self.arrays:
+                indice[key_array] = []
+            for (key_array, label), entry in self.entries.items():
+                indice[key_array].append(
+                    {
+                        "label": label,
+                        "indice": (
+                            entry.to_json()
+                            if isinstance(entry, RecosanteIndice)
+                            else entry
+                        ),
+                    }
+                )
+        json = {"indice": indice}
+        if self.source is not None:
+            json["sources"] = [{"label": self.source}]
+        if self.validity_json is not None:
+            json["validity"] = dict(self.validity_json)
+        return json
+
+    def get_key(self, key_array, key):
+        """Get value for the given key"""
+        if key_array in self.arrays:
+            return self.entries.get((key_array, key))
+        return self.indice
+
+    def get_value(self, key_array, key):
+        """Get the value or level of the given key, as shown by its sensor"""
+        entry = self.get_key(key_array, key)
+        if not isinstance(entry, RecosanteIndice):
+            return None
+        return entry.value if entry.value is not None else entry.level
+
+    def get_label(self, key_array, key):
+        """Get the label of the given key"""
+        entry = self.get_key(key_array, key)
+        return entry.label if isinstance(entry, RecosanteIndice) else None
+
+    def _header(self) -> tuple:
+        """Everything but the indexed entries, for comparison"""
+        return (
+            self.indice,
+            self.arrays,
+            self.source,
+            self.forecast_dates,
+            self.validity,
+        )
+
+    def diff(self, key_category, previous: RecosanteCategory) -> set[tuple]:
+        """Keys of the entries which changed since previous data"""
+        if self._header() != previous._header():
+            return {(key_category, None, None)}
+        return {
+            (key_category,) + key
+            for key in self.entries.keys() | previous.entries.keys()
+            if self.entries.get(key) != previous.entries.get(key)
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class RecosanteData:
+    """Parsed response of the Recosanté API, indexed by category
+
+    Only the parsed categories are kept, not the JSON tree of the response.
+    """
+
+    categories: Mapping[str, RecosanteCategory]
+
+    @classmethod
+    def from_json(
+        cls,
+        json: dict,
+        categories: Collection[str] | None = None,
+        paths: Mapping[str, Mapping[str, frozenset]] | None = None,
+    ) -> RecosanteData:
+        """Parse and index the JSON response once
+
+        When categories are given, the other ones are dropped. When paths
+        are given, only the categories, arrays and labels they list are kept.
+        """
+        if not isinstance(json, dict):
+            json = {}
+        return cls(
+            categories=MappingProxyType(
+                {
+                    key_category: RecosanteCategory.from_json(
+                        category, paths[key_category] if paths is not None else None
+                    )
+                    for key_category, category in json.items()
+                    if isinstance(category, dict)
+                    and (categories is None or key_category in categories)
+                    and (paths is None or key_category in paths)
+                }
+            )
+        )
+
+    def to_json(self) -> dict:
+        """The response as returned by the API, without the dropped fields"""
+        return {
+            key_category: category.to_json()
+            for key_category, category in self.categories.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    def diff(self, previous: RecosanteData | None) -> frozenset[tuple] | None:
+        """Keys (category, array, label) which changed since previous data
+
+        (category, None, None) means the whole category changed, None means
+        everything changed.
+        """
+        if previous is None:
+            return None
+        if previous is self:
+            return frozenset()
+        changes = set()
+        for key_category in self.categories.keys() | previous.categories.keys():
+            category = self.categories.get(key_category)
+            previous_category = previous.categories.get(key_category)
+            if category is previous_category:
+                continue
+            if category is None or previous_category is None:
+                changes.add((key_category, None, None))
+            else:
+                changes |= category.diff(key_category, previous_category)
+        return frozenset(changes)
+
+    def validity_ends(self) -> list[str | None]:
+        """End of the validity window of every category"""
+        return [category.forecast_dates[1] for category in self.categories.values()]
+
+    def get_key(self, key_category, key_array, key):
+        """Get value for the given key"""
+        category = self.categories.get(key_category)
+        return category.get_key(key_array, key) if category is not None else None
+
+    def get_value(self, key_category, key_array, key):
+        """Get the value or level of the given key, as shown by its sensor"""
+        category = self.categories.get(key_category)
+        return category.get_value(key_array, key) if category is not None else None
+
+    def get_label(self, key_category, key_array, key):
+        """Get the label of the given key"""
+        category = self.categories.get(key_category)
+        return category.get_label(key_array, key) if category is not None else None
+
+    def get_source(self, key_category):
+        """Get value for source of data"""
+        category = self.categories.get(key_category)
+        return category.source if category is not None else None
+
+    def get_forecast_dates(self, key_category):
+        """Get value of data update"""
+        category = self.categories.get(key_category)
+        return category.forecast_dates if category is not None else (None, None)
+
+    def get_validity(self, key_category):
+        """Get value of validity"""
+        category = self.categories.get(key_category)
+        return category.validity if category is not None else None
+
+
+EMPTY_DATA = RecosanteData(categories=MappingProxyType({}))
@@ -0,0 +1,240 @@
+""" Limitation du débit des requêtes, globale et par hôte """
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import heapq
+import itertools
+import time
+
+from .const import (
+    RATE_LIMIT_BACKOFF,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_HOST_BURST,
+    RATE_LIMIT_HOST_RATE,
+    RATE_LIMIT_MAX_RETRY_AFTER,
+    RATE_LIMIT_MAX_WAIT,
+    RATE_LIMIT_RATE,
+)
+
+# Priorities of the requests, the lowest is sent first
+PRIORITY_STALE = 0
+PRIORITY_FRESH = 1
+PRIORITY_FORECAST = 2
+
+
+class RateLimitedError(Exception):
+    """Requests to the host are paused for longer than a request may wait"""
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Delay in seconds of a Retry-After header, as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return min(max(delay, 0.0), RATE_LIMIT_MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    """rate requests per second on average, up to burst at once"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds before a token is available"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Consume a token, once delay returned 0"""
+        self.tokens -= 1
+
+
+@dataclass(order=True, slots=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    host: str
+    future: asyncio.Future
+
+
+class RateLimiter:
+    """Token buckets shared by every client: one for all hosts, one per host
+
+    Requests waiting for a token are granted by priority, then in order of
+    arrival. A host answering 429 or 503 with Retry-After is paused until
+    the given time, the requests to the other hosts go on. A 429 without
+    Retry-After pauses the host for backoff seconds, doubled on every new
+    one until the host answers again. Requests wait for a short pause to
+    end, they fail right away during a long one.
+    """
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT_RATE,
+        burst: float = RATE_LIMIT_BURST,
+        host_rate: float = RATE_LIMIT_HOST_RATE,
+        host_burst: float = RATE_LIMIT_HOST_BURST,
+        max_wait: float = RATE_LIMIT_MAX_WAIT,
+        backoff: float = RATE_LIMIT_BACKOFF,
+    ) -> None:
+        self._bucket = TokenBucket(rate, burst)
+        self._host_rate = host_rate
+        self._host_burst = host_burst
+        self._max_wait = max_wait
+        self._backoff = backoff
+        self._hosts: dict[str, TokenBucket] = {}
+        self._paused_until: dict[str, float] = {}
+        # Consecutive pauses without Retry-After, by host
+        self._backoffs: dict[str, int] = {}
+        self._waiters: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self.granted = 0
+        self.delayed = 0
+        self.waited = 0.0
+        self.throttled = 0
+
+    def _host_bucket(self, host: str) -> TokenBucket:
+        if host not in self._hosts:
+            self._hosts[host] = TokenBucket(self._host_rate, self._host_burst)
+        return self._hosts[host]
+
+    def _delay(self, host: str, now: float) -> float:
+        """Seconds before a request to host may be sent"""
+        return max(
+            self._paused_until.get(host, 0.0) - now,
+            self._bucket.delay(now),
+            self._host_bucket(host).delay(now),
+        )
+
+    async def async_acquire(self, host: str, priority: int = PRIORITY_FRESH) -> None:
+        """Wait until a request to host may be sent, raise RateLimitedError otherwise"""
+        if (retry_in := self.retry_in(host)) > self._max_wait:
+            raise RateLimitedError(f"Rate limited, retry in {retry_in:.0f}s")
+        now = time.monotonic()
+        if not self._waiters and self._delay(host, now) <= 0:
+            self._grant(host)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters, _Waiter(priority, next(self._sequence), host, future)
+        )
+        self.delayed += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The token was granted meanwhile, let the next request use it
+                self._bucket.tokens += 1
+                self._host_bucket(host).tokens += 1
+                self.granted -= 1
+            else:
+                self._waiters = [
+                    waiter for waiter in self._waiters if waiter.future is not future
+                ]
+                heapq.heapify(self._waiters)
+            self._dispatch()
+            raise
+        finally:
+            self.waited += time.monotonic() - now
+
+    def _grant(self, host: str) -> None:
+        self._bucket.take()
+        self._host_bucket(host).take()
+        self.granted += 1
+
+    def _dispatch(self) -> None:
+        """Grant the waiting requests which may be sent, by priority"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        next_delay = None
+        remaining = []
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            if waiter.future.done():
+                continue
+            delay = self._delay(waiter.host, now)
+            if delay <= 0:
+                self._grant(waiter.host)
+                waiter.future.set_result(None)
+                continue
+            remaining.append(waiter)
+            next_delay = delay if next_delay is None else min(next_delay, delay)
+            if self._bucket.delay(now) > 0:
+                # No request to any host can be sent before a global token
+                break
+        for waiter in remaining:
+            heapq.heappush(self._waiters, waiter)
+        if next_delay is not None:
+            self._timer = asyncio.get_running_loop().call_later(
+                next_delay, self._dispatch
+            )
+
+    def pause(self, host: str, delay: float) -> None:
+        """Send no request to host for delay seconds, as asked by Retry-After"""
+        self.throttled += 1
+        self._paused_until[host] = max(
+            self._paused_until.get(host, 0.0), time.monotonic() + delay
+        )
+
+    def back_off(self, host: str) -> None:
+        """Pause host after a 429 without Retry-After, longer each time
+
+        The 429 answered to the requests sent before the pause count once.
+        """
+        if self.retry_in(host) > 0:
+            return
+        backoffs = self._backoffs.get(host, 0)
+        self._backoffs[host] = backoffs + 1
+        self.pause(host, min(self._backoff * 2**backoffs, RATE_LIMIT_MAX_RETRY_AFTER))
+
+    def reset_backoff(self, host: str) -> None:
+        """The host answered, the next pause starts from backoff again"""
+        self._backoffs.pop(host, None)
+
+    def retry_in(self, host: str) -> float:
+        """Seconds before the pause of a host ends"""
+        return max(0.0, self._paused_until.get(host, 0.0) - time.monotonic())
+
+    def as_dict(self) -> dict:
+        """State of the limiter, for diagnostics"""
+        return {
+            "granted": self.granted,
+            "delayed": self.delayed,
+            "waited_s": round(self.waited, 3),
+            "waiting": len(self._waiters),
+            "throttled": self.throttled,
+            "paused_s": {
+                host: round(self.retry_in(host), 1)
+                for host in self._paused_until
+                if self.retry_in(host) > 0
+            },
+        }
@@ -0,0 +1,126 @@
+""" Données départementales partagées entre les communes d'un même département """
+from __future__ import annotations
+
+from collections.abc import Collection
+from types import MappingProxyType
+
+from .const import DEPARTMENT_AREA_TYPES, OPTIONAL_CATEGORIES
+from .model import RecosanteCategory, RecosanteData
+from .scheduler import is_stale
+
+
+def department(insee_code: str) -> str:
+    """Department of a commune, from its INSEE code"""
+    return insee_code[:3] if insee_code.startswith("97") else insee_code[:2]
+
+
+class AreaIndex:
+    """Categories published per department, shared by its communes
+
+    The area of every category is learned from the payloads. A category
+    published per department is parsed once and the same object is shared by
+    every commune of the department. An optional category is only requested
+    for one commune of each department, the leader, and copied to the others.
+    """
+
+    def __init__(self) -> None:
+        self._department_categories: set[str] = set()
+        # (category, department) -> parsed category
+        self._shared: dict[tuple[str, str], RecosanteCategory] = {}
+        # Last output of share, and last input and output of compose, by
+        # INSEE code
+        self._shared_data: dict[str, RecosanteData] = {}
+        self._composed: dict[str, tuple[RecosanteData, tuple, RecosanteData]] = {}
+
+    def omitted(
+        self,
+        insee_code: str,
+        categories: Collection[str],
+        requests: dict[str, frozenset[str]],
+    ) -> frozenset[str]:
+        """Optional categories which do not have to be requested for a commune
+
+        requests gives the categories of every commune fetched together.
+        """
+        area = department(insee_code)
+        omitted = set()
+        for category in categories:
+            shared = self._shared.get((category, area))
+            if (
+                category not in OPTIONAL_CATEGORIES
+                or category not in self._department_categories
+                or shared is None
+                # Every commune requests it again until the leader gets it
+                or is_stale([shared.forecast_dates[1]])
+            ):
+                continue
+            leader = min(
+                (
+                    code
+                    for code, wanted in requests.items()
+                    if category in wanted and department(code) == area
+                ),
+                default=insee_code,
+            )
+            if leader != insee_code:
+                omitted.add(category)
+        return frozenset(omitted)
+
+    def share(self, insee_code: str, data: RecosanteData) -> RecosanteData:
+        """Replace the department categories of data by their shared objects
+
+        The client of the commune is expected to keep the returned data
+        instead of data, which is returned as is when it comes back.
+        """
+        if self._shared_data.get(insee_code) is data:
+            return data
+        area = department(insee_code)
+        categories = dict(data.categories)
+        for key_category, category in data.categories.items():
+            if category.area_type not in DEPARTMENT_AREA_TYPES:
+                self._department_categories.discard(key_category)
+                continue
+            self._department_categories.add(key_category)
+            shared = self._shared.get((key_category, area))
+            if shared is not None and shared == category:
+                categories[key_category] = shared
+            elif shared is None or (category.forecast_dates[0] or "") >= (
+                shared.forecast_dates[0] or ""
+            ):
+                # Never replace shared data by older data
+                self._shared[(key_category, area)] = category
+        shared_data = RecosanteData(categories=MappingProxyType(categories))
+        self._shared_data[insee_code] = shared_data
+        return shared_data
+
+    def compose(
+        self, insee_code: str, data: RecosanteData, categories: Collection[str]
+    ) -> RecosanteData:
+        """Add the shared categories that were not requested for a commune"""
+        area = department(insee_code)
+        shared = tuple(
+            (key_category, self._shared[(key_category, area)])
+            for key_category in sorted(categories)
+            if key_category not in data.categories
+            and (key_category, area) in self._shared
+        )
+        if not shared:
+            return data
+        last = self._composed.get(insee_code)
+        if (
+            last is not None
+            and last[0] is data
+            and len(last[1]) == len(shared)
+            and all(a[1] is b[1] for a, b in zip(last[1], shared))
+        ):
+            return last[2]
+        composed = RecosanteData(
+            categories=MappingProxyType({**data.categories, **dict(shared)})
+        )
+        self._composed[insee_code] = (data, shared, composed)
+        return composed
+
+    def forget(self, insee_code: str) -> None:
+        """Drop what is kept for a commune which is not tracked anymore"""
+        self._shared_data.pop(insee_code, None)
+        self._composed.pop(insee_code, None)
@@ -0,0 +1,102 @@
+""" Planification des mises à jour à partir des périodes de validité """
+from __future__ import annotations
+
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+import random
+
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    BACKOFF_MAX_INTERVAL,
+    BACKOFF_MIN_INTERVAL,
+    MAX_REFRESH_INTERVAL,
+    MIN_REFRESH_INTERVAL,
+    PUBLICATION_REFRESH_INTERVAL,
+    PUBLICATION_WINDOW,
+    REFRESH_INTERVAL,
+)
+
+
+def parse_validity_end(value: str | None) -> datetime | None:
+    """Parse the end of a validity window as an UTC datetime"""
+    if not value:
+        return None
+    if (parsed := dt_util.parse_datetime(value)) is not None:
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+        return dt_util.as_utc(parsed)
+    if (day := dt_util.parse_date(value)) is not None:
+        # A date alone is valid until the end of that day
+        return dt_util.as_utc(dt_util.start_of_local_day(day + timedelta(days=1)))
+    return None
+
+
+def validity_end(validity_ends: Iterable[str | None]) -> datetime | None:
+    """Earliest end of the given validity windows"""
+    ends = [end for end in map(parse_validity_end, validity_ends) if end]
+    return min(ends) if ends else None
+
+
+def is_stale(validity_ends: Iterable[str | None]) -> bool:
+    """Whether a validity window has passed"""
+    end = validity_end(validity_ends)
+    return end is not None and end <= dt_util.utcnow()
+
+
+class RefreshScheduler:
+    """Compute the delay before the next refresh"""
+
+    def __init__(
+        self,
+        default_interval: timedelta = timedelta(minutes=REFRESH_INTERVAL),
+        min_interval: timedelta = timedelta(minutes=MIN_REFRESH_INTERVAL),
+        max_interval: timedelta = timedelta(minutes=MAX_REFRESH_INTERVAL),
+        publication_interval: timedelta = timedelta(
+            minutes=PUBLICATION_REFRESH_INTERVAL
+        ),
+        publication_window: timedelta = timedelta(minutes=PUBLICATION_WINDOW),
+        backoff_min: timedelta = timedelta(minutes=BACKOFF_MIN_INTERVAL),
+        backoff_max: timedelta = timedelta(minutes=BACKOFF_MAX_INTERVAL),
+    ) -> None:
+        self._default_interval = default_interval
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._publication_interval = publication_interval
+        self._publication_window = publication_window
+        self._backoff_min = backoff_min
+        self._backoff_max = backoff_max
+        self.failures = 0
+
+    def next_interval(
+        self, validity_ends: Iterable[str | None], now: datetime | None = None
+    ) -> timedelta:
+        """Delay before the next refresh after a successful one
+
+        While every category is valid, wait until the first one expires.
+        Once a category expired, poll more often until its new data is
+        published. Categories expired for longer than the publication window
+        are not published anymore and fall back to the default interval.
+        """
+        self.failures = 0
+        now = now or dt_util.utcnow()
+        ends = [end for end in map(parse_validity_end, validity_ends) if end]
+        if not ends:
+            return self._default_interval
+
+        expired = [end for end in ends if end <= now]
+        if any(now - end < self._publication_window for end in expired):
+            return self._publication_interval
+        if expired:
+            return self._default_interval
+
+        next_end = min(ends) - now + self._min_interval
+        return max(self._min_interval, min(self._max_interval, next_end))
+
+    def failure_interval(self) -> timedelta:
+        """Delay before the next refresh after a failure, with jittered backoff"""
+        self.failures += 1
+        delay = min(
+            self._backoff_max, self._backoff_min * 2 ** min(self.failures - 1, 16)
+        )
+        return random.uniform(0.5, 1) * delay
@@ -1,6 +1,7 @@
 """ Implements the sensors component """
+from functools import lru_cache
 import logging
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.components.sensor import (
@@ -9,6 +10,7 @@ from homeassistant.components.sensor import (
 )
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers import entity_registry as er
 
 from homeassistant.helpers.update_coordinator import (
     CoordinatorEntity,
@@ -17,22 +19,29 @@ from .const import (
     DOMAIN,
     COORDINATOR,
     ATTRIBUTION,
-    ATMO_SENSORS,
-    METEO_SENSORS,
-    POLLUTION_SENSORS,
-    RADON_SENSORS,
-    RAEP_SENSORS,
-    UV_SENSORS,
+    AGGREGATE_SENSORS,
+    DIAGNOSTIC_SENSORS,
+    CONF_CATEGORIES,
     CONF_CITY,
     CONF_INSEE_CODE,
+    DEFAULT_CATEGORIES,
     MODEL,
     TITLE,
+    RecosanteAggregateEntityDescription,
     RecosanteSensorEntityDescription,
 )
+from .descriptions import CompiledSensor, EntryNames, sensors_of
+from .model import EMPTY_DATA, RecosanteData, intern
 
 _LOGGER = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
+def _attribution(source: str) -> str:
+    """Attribution of the sensors of a source, shared by every entry"""
+    return f"{ATTRIBUTION} - {source}"
+
+
 async def async_setup_entry(
     hass: HomeAssistant,
     entry: ConfigEntry,
@@ -42,18 +51,88 @@ async def async_setup_entry(
     config = hass.data[DOMAIN][entry.entry_id]
     coordinator = config[COORDINATOR]
 
+    insee_code = entry.data.get(CONF_INSEE_CODE)
+    if insee_code in coordinator.data:
+        # Data has already been fetched by the coordinator, or loaded from cache
+        _async_add_entities(hass, entry, coordinator, async_add_entities)
+        return
+
+    # Home Assistant is starting without cached data for this commune, the
+    # entities are created once the first fetch brings their data
+    remove_listener: CALLBACK_TYPE | None = None
+
+    @callback
+    def _async_remove_listener() -> None:
+        nonlocal remove_listener
+        if remove_listener is not None:
+            remove_listener()
+            remove_listener = None
+
+    @callback
+    def _async_data_received() -> None:
+        if insee_code in coordinator.data:
+            _async_remove_listener()
+            _async_add_entities(hass, entry, coordinator, async_add_entities)
+
+    remove_listener = coordinator.async_add_listener(_async_data_received)
+    entry.async_on_unload(_async_remove_listener)
+
+
+@callback
+def _async_add_entities(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    coordinator,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Create the sensors of an entry from the data of its commune"""
+    categories = entry.options.get(CONF_CATEGORIES, DEFAULT_CATEGORIES)
+    data = coordinator.data.get(entry.data.get(CONF_INSEE_CODE), EMPTY_DATA)
+
+    # The sensors of a source share their device info
+    device_infos: dict[str | None, DeviceInfo] = {}
+    for category in categories:
+        source = data.get_source(category)
+        if source not in device_infos:
+            device_infos[source] = DeviceInfo(
+                name=TITLE,
+                entry_type=DeviceEntryType.SERVICE,
+                identifiers={(DOMAIN, f"{source} - {entry.data.get(CONF_CITY)}")},
+                manufacturer=intern(f"{source}"),
+                model=MODEL,
+            )
+
+    names = EntryNames.from_entry(entry)
     entities = [
-        RecosanteEntity(hass, entry, sensor_description, coordinator)
-        for sensor_description in (
-            ATMO_SENSORS
-            + METEO_SENSORS
-            + POLLUTION_SENSORS
-            + RADON_SENSORS
-            + RAEP_SENSORS
-            + UV_SENSORS
+        RecosanteEntity(
+            names, sensor, coordinator, device_infos[data.get_source(sensor.category)]
+        )
+        for sensor in sensors_of(categories)
+    ]
+    _LOGGER.debug("Creating %s Recosanté sensors for %s", len(entities), entry.title)
+    entities += [
+        RecosanteAggregateEntity(
+            names,
+            sensor_description,
+            coordinator,
+            device_infos[data.get_source(sensor_description.category)],
         )
+        for sensor_description in AGGREGATE_SENSORS
+        if sensor_description.category in categories
+    ]
+    entities += [
+        RecosanteDiagnosticEntity(names, sensor_description, coordinator)
+        for sensor_description in DIAGNOSTIC_SENSORS
     ]
-    async_add_entities(entities, True)
+
+    # Remove the sensors of the categories which are not selected anymore
+    registry = er.async_get(hass)
+    unique_ids = {entity.unique_id for entity in entities}
+    for registry_entry in er.async_entries_for_config_entry(registry, entry.entry_id):
+        if registry_entry.unique_id not in unique_ids:
+            registry.async_remove(registry_entry.entity_id)
+
+    async_add_entities(entities)
 
 
 class RecosanteEntity(CoordinatorEntity, SensorEntity):
@@ -61,74 +140,144 @@ class RecosanteEntity(CoordinatorEntity, SensorEntity):
 
     entity_description: RecosanteSensorEntityDescription
 
+    # Value and attributes, computed once per data and forecasts of the commune
+    _state_data: RecosanteData | None = None
+    _state_version = 0
+    _state: tuple = (None, None)
+
     def __init__(
         self,
-        hass: HomeAssistant,
-        entry_infos,
-        description: SensorEntityDescription,
+        names: EntryNames,
+        sensor: CompiledSensor,
         coordinator,
+        device_info: DeviceInfo,
     ) -> None:
         """Initisalisation de l'entité"""
         super().__init__(coordinator)
 
-        self._hass = hass
-        self.entity_description = description
-        self._attr_name = f"{description.name} - {entry_infos.data.get(CONF_CITY)}"
-        self._attr_unique_id = f"{entry_infos.entry_id} - {entry_infos.data.get(CONF_INSEE_CODE)} - {description.name}"
-        self._coordinator = coordinator
-        self._attr_attribution = f"{ATTRIBUTION} - {self._coordinator.api.get_source(self.entity_description.json_keys.category)}"
-        self._attr_device_class = description.device_class
-
-        self._attr_device_info = DeviceInfo(
-            name=TITLE,
-            entry_type=DeviceEntryType.SERVICE,
-            identifiers={
-                (
-                    DOMAIN,
-                    f"{self._coordinator.api.get_source(self.entity_description.json_keys.category)} - {entry_infos.data.get(CONF_CITY)}",
-                )
-            },
-            manufacturer=f"{self._coordinator.api.get_source(self.entity_description.json_keys.category)}",
-            model=MODEL,
-        )
-        _LOGGER.debug("Creating a Recosanté sensor, named %s", self._attr_name)
+        self.entity_description = sensor.description
+        self._sensor = sensor
+        # Everything else is formatted once per entry or per sensor
+        self._attr_name = sensor.name + names.name_suffix
+        self._attr_unique_id = names.unique_id_prefix + sensor.name
+        self._insee_code = names.insee_code
+        self._attr_attribution = _attribution(device_info["manufacturer"])
+        self._attr_device_info = device_info
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Only write the state when the sensor data changed"""
+        if self.coordinator.last_update_success and not self.coordinator.has_changed(
+            self._insee_code, self._sensor.changes
+        ):
+            self.coordinator.skipped_writes += 1
+            return
+        super()._handle_coordinator_update()
+
+    @property
+    def _data(self) -> RecosanteData:
+        """Data of the commune of this sensor"""
+        return self.coordinator.data.get(self._insee_code, EMPTY_DATA)
+
+    @property
+    def available(self) -> bool:
+        return super().available and self._insee_code in self.coordinator.data
 
     @property
     def native_value(self):
-        value = self._coordinator.api.get_key(
-            self.entity_description.json_keys.category,
-            self.entity_description.json_keys.array,
-            self.entity_description.json_keys.label,
-        )
-        if value is not None:
-            if "value" in value:
-                value = value.get("value")
-            elif "level" in value:
-                value = value.get("level")
-            else:
-                value = None
+        return self._get_state()[0]
+
+    @property
+    def extra_state_attributes(self):
+        return self._get_state()[1]
+
+    def _get_state(self) -> tuple:
+        """Value and attributes, computed again only when new data arrived"""
+        data = self._data
+        version = self.coordinator.forecast_version(self._insee_code)
+        if data is not self._state_data or version != self._state_version:
+            self._state_data = data
+            self._state_version = version
+            self._state = self._compute_state(data)
+        return self._state
+
+    def _compute_state(self, data: RecosanteData) -> tuple:
+        value, attributes = self._sensor.get_state(data)
         _LOGGER.debug("Value for sensor %s is now %s", self._attr_name, value)
-        return value
+        if self._sensor.forecast:
+            attributes["forecast"] = self.coordinator.get_forecast(
+                self._insee_code, self._sensor.key
+            )
+        return value, attributes
+
+
+class RecosanteAggregateEntity(CoordinatorEntity, SensorEntity):
+    """Value computed from the sensors of a category, such as the highest one"""
+
+    def __init__(
+        self,
+        names: EntryNames,
+        description: RecosanteAggregateEntityDescription,
+        coordinator,
+        device_info: DeviceInfo,
+    ) -> None:
+        super().__init__(coordinator)
+
+        self.entity_description = description
+        self._attr_name = description.name + names.name_suffix
+        self._attr_unique_id = names.unique_id_prefix + description.key
+        self._insee_code = names.insee_code
+        self._attr_attribution = _attribution(device_info["manufacturer"])
+        self._attr_device_info = device_info
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Only write the state when the data of the category changed"""
+        if (
+            self.coordinator.last_update_success
+            and not self.coordinator.category_changed(
+                self._insee_code, self.entity_description.category
+            )
+        ):
+            self.coordinator.skipped_writes += 1
+            return
+        super()._handle_coordinator_update()
+
+    @property
+    def available(self) -> bool:
+        return super().available and self._insee_code in self.coordinator.data
+
+    @property
+    def native_value(self):
+        return self._get_state()[0]
 
     @property
     def extra_state_attributes(self):
-        (forecast_start, forecast_end) = self._coordinator.api.get_forecast_dates(
-            self.entity_description.json_keys.category
+        return self._get_state()[1]
+
+    def _get_state(self) -> tuple:
+        return self.coordinator.get_aggregates(self._insee_code).get(
+            self.entity_description.key, (None, None)
         )
-        return {
-            "forecast_start": forecast_start,
-            "forecast_end": forecast_end,
-            "label": self._level2string(
-                self._coordinator.api.get_key(
-                    self.entity_description.json_keys.category,
-                    self.entity_description.json_keys.array,
-                    self.entity_description.json_keys.label,
-                )
-            ),
-            "area_validity": self._coordinator.api.get_validity(
-                self.entity_description.json_keys.category
-            ),
-        }
-
-    def _level2string(self, value):
-        return value.get("label") if value else None
+
+
+class RecosanteDiagnosticEntity(CoordinatorEntity, SensorEntity):
+    """Statistics of the last fetch of the commune"""
+
+    def __init__(
+        self,
+        names: EntryNames,
+        description: SensorEntityDescription,
+        coordinator,
+    ) -> None:
+        super().__init__(coordinator)
+
+        self.entity_description = description
+        self._attr_name = description.name + names.name_suffix
+        self._attr_unique_id = names.unique_id_prefix + description.key
+        self._insee_code = names.insee_code
+
+    @property
+    def native_value(self):
+        stats = self.coordinator.stats.communes.get(self._insee_code)
+        return stats.as_dict().get(self.entity_description.key) if stats else None
@@ -0,0 +1,175 @@
+""" Services de l'intégration Recosanté """
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterable
+import logging
+
+import voluptuous as vol
+
+from homeassistant.config_entries import SOURCE_IMPORT
+from homeassistant.core import HomeAssistant, ServiceCall, callback
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.util import dt as dt_util
+
+from .api import INSEEAPI
+from .archive import async_get_archive
+from .const import (
+    CATEGORIES,
+    CONF_CATEGORIES,
+    CONF_CITY,
+    CONF_END,
+    CONF_INSEE_CODE,
+    CONF_INSEE_CODES,
+    CONF_KEYS,
+    CONF_START,
+    CONF_ZIP_CODES,
+    DEFAULT_CATEGORIES,
+    DOMAIN,
+    EVENT_HISTORY,
+    MAX_CONCURRENT_REQUESTS,
+    SENSORS,
+    SERVICE_ADD_COMMUNES,
+    SERVICE_GET_HISTORY,
+)
+from .insee_index import get_insee_index
+
+_LOGGER = logging.getLogger(__name__)
+
+PROVISION_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_ZIP_CODES, default=[]): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(CONF_INSEE_CODES, default=[]): vol.All(
+            cv.ensure_list, [cv.string]
+        ),
+        vol.Optional(CONF_CATEGORIES, default=DEFAULT_CATEGORIES): vol.All(
+            cv.ensure_list, vol.Length(min=1), [vol.In(CATEGORIES)]
+        ),
+    }
+)
+
+HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_INSEE_CODE): cv.string,
+        vol.Required(CONF_START): cv.date,
+        vol.Optional(CONF_END): cv.date,
+        vol.Optional(CONF_KEYS, default=[]): vol.All(
+            cv.ensure_list, [vol.In([description.key for description in SENSORS])]
+        ),
+    }
+)
+
+CONFIG_SCHEMA = vol.Schema({DOMAIN: PROVISION_SCHEMA}, extra=vol.ALLOW_EXTRA)
+
+
+async def async_resolve_communes(
+    hass: HomeAssistant, zip_codes: Iterable[str], insee_codes: Iterable[str]
+) -> dict[str, str]:
+    """Names of the communes of the given postal and INSEE codes, by INSEE code
+
+    Every commune of a postal code is returned. Postal codes missing from the
+    local index are looked up online, a few at a time.
+    """
+    index = await hass.async_add_executor_job(get_insee_index)
+    communes = {}
+    for insee_code in insee_codes:
+        communes[insee_code] = index.name(insee_code) or insee_code
+    missing = []
+    for zip_code in zip_codes:
+        if found := index.lookup(zip_code):
+            communes.update((commune["code"], commune["nom"]) for commune in found)
+        else:
+            missing.append(zip_code)
+    if not missing:
+        return communes
+
+    client = INSEEAPI(async_get_clientsession(hass))
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def _async_lookup(zip_code: str) -> list[dict]:
+        async with semaphore:
+            try:
+                return await client.get_data(zip_code)
+            except (ValueError, asyncio.TimeoutError, OSError) as err:
+                _LOGGER.warning("No INSEE code found for %s: %s", zip_code, err)
+                return []
+
+    for found in await asyncio.gather(*map(_async_lookup, missing)):
+        communes.update((commune["code"], commune["nom"]) for commune in found)
+    return communes
+
+
+async def async_provision(hass: HomeAssistant, config: dict) -> None:
+    """Create the entries of many communes, fetching their data in one wave"""
+    # pylint: disable-next=import-outside-toplevel
+    from . import async_get_coordinator, async_release_coordinator
+
+    communes = await async_resolve_communes(
+        hass, config[CONF_ZIP_CODES], config[CONF_INSEE_CODES]
+    )
+    configured = {
+        entry.data.get(CONF_INSEE_CODE)
+        for entry in hass.config_entries.async_entries(DOMAIN)
+    }
+    communes = {code: name for code, name in communes.items() if code not in configured}
+    if not communes:
+        return
+
+    categories = list(config[CONF_CATEGORIES])
+    coordinator = async_get_coordinator(hass)
+    try:
+        # Entries of communes with data are set up without fetching again
+        available = await coordinator.async_prefetch(communes, categories)
+        await asyncio.gather(
+            *(
+                hass.config_entries.flow.async_init(
+                    DOMAIN,
+                    context={"source": SOURCE_IMPORT},
+                    data={
+                        CONF_INSEE_CODE: insee_code,
+                        CONF_CITY: name,
+                        CONF_CATEGORIES: categories,
+                    },
+                )
+                for insee_code, name in communes.items()
+            )
+        )
+    finally:
+        coordinator.async_forget_unregistered()
+        await async_release_coordinator(hass)
+    _LOGGER.info(
+        "Added %s communes, %s of them with data", len(communes), len(available)
+    )
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the services of the integration"""
+
+    async def _async_add_communes(call: ServiceCall) -> None:
+        await async_provision(hass, call.data)
+
+    async def _async_get_history(call: ServiceCall) -> None:
+        start = call.data[CONF_START]
+        end = call.data.get(CONF_END, dt_util.now().date())
+        history = await async_get_archive(hass).async_query(
+            call.data[CONF_INSEE_CODE], start, end, call.data[CONF_KEYS]
+        )
+        hass.bus.async_fire(
+            EVENT_HISTORY,
+            {
+                CONF_INSEE_CODE: call.data[CONF_INSEE_CODE],
+                CONF_START: start.isoformat(),
+                CONF_END: end.isoformat(),
+                **history,
+            },
+            context=call.context,
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_ADD_COMMUNES, _async_add_communes, schema=PROVISION_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_GET_HISTORY, _async_get_history, schema=HISTORY_SCHEMA
+    )
@@ -0,0 +1,126 @@
+""" Mesures des mises à jour Recosanté """
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+import time
+from types import SimpleNamespace
+
+import aiohttp
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+@dataclass(slots=True)
+class FetchStats:
+    """Timings of the fetch of one commune"""
+
+    # Wait for the rate limiter, the breaker and a free request slot
+    queue: float = 0.0
+    dns: float = 0.0
+    connect: float = 0.0
+    transfer: float = 0.0
+    decode: float = 0.0
+    index: float = 0.0
+    duration: float = 0.0
+    payload_bytes: int = 0
+    not_modified: bool = False
+    error: str | None = None
+
+    def as_dict(self) -> dict:
+        """Timings in milliseconds"""
+        return {
+            "queue_ms": _ms(self.queue),
+            "dns_ms": _ms(self.dns),
+            "connect_ms": _ms(self.connect),
+            "transfer_ms": _ms(self.transfer),
+            "decode_ms": _ms(self.decode),
+            "index_ms": _ms(self.index),
+            "duration_ms": _ms(self.duration),
+            "payload_bytes": self.payload_bytes,
+            "not_modified": self.not_modified,
+            "error": self.error,
+        }
+
+
+class RefreshStats:
+    """Timings of the refreshes of the coordinator"""
+
+    def __init__(self) -> None:
+        self.refreshes = 0
+        self.duration = 0.0
+        self.fan_out = 0.0
+        self.setups = 0
+        self.setup = 0.0
+        self.setup_max = 0.0
+        self.startup_wave = 0.0
+        self.errors: Counter[str] = Counter()
+        self.communes: dict[str, FetchStats] = {}
+
+    def add_fetch(self, insee_code: str, stats: FetchStats) -> None:
+        """Record the fetch of a commune"""
+        self.communes[insee_code] = stats
+        if stats.error is not None:
+            self.errors[stats.error] += 1
+
+    def add_setup(self, duration: float) -> None:
+        """Record the setup of a config entry"""
+        self.setups += 1
+        self.setup += duration
+        self.setup_max = max(self.setup_max, duration)
+
+    def as_dict(self) -> dict:
+        """Totals of the last fetch of every commune, in milliseconds"""
+        fetches = list(self.communes.values())
+        return {
+            "refreshes": self.refreshes,
+            "duration_ms": _ms(self.duration),
+            "fan_out_ms": _ms(self.fan_out),
+            "setups": self.setups,
+            "setup_ms": _ms(self.setup),
+            "setup_max_ms": _ms(self.setup_max),
+            "startup_wave_ms": _ms(self.startup_wave),
+            "queue_ms": _ms(sum(stats.queue for stats in fetches)),
+            "dns_ms": _ms(sum(stats.dns for stats in fetches)),
+            "connect_ms": _ms(sum(stats.connect for stats in fetches)),
+            "transfer_ms": _ms(sum(stats.transfer for stats in fetches)),
+            "decode_ms": _ms(sum(stats.decode for stats in fetches)),
+            "index_ms": _ms(sum(stats.index for stats in fetches)),
+            "payload_bytes": sum(stats.payload_bytes for stats in fetches),
+            "not_modified": sum(stats.not_modified for stats in fetches),
+            "errors": dict(self.errors),
+        }
+
+
+async def _on_dns_start(session, context: SimpleNamespace, params) -> None:
+    context.dns_start = time.perf_counter()
+
+
+async def _on_dns_end(session, context: SimpleNamespace, params) -> None:
+    if isinstance(stats := context.trace_request_ctx, FetchStats):
+        stats.dns += time.perf_counter() - context.dns_start
+
+
+async def _on_connection_start(session, context: SimpleNamespace, params) -> None:
+    context.connection_start = time.perf_counter()
+    if isinstance(stats := context.trace_request_ctx, FetchStats):
+        context.connection_dns = stats.dns
+
+
+async def _on_connection_end(session, context: SimpleNamespace, params) -> None:
+    if isinstance(stats := context.trace_request_ctx, FetchStats):
+        # Name resolution happens while connecting, it is counted apart
+        dns = stats.dns - context.connection_dns
+        stats.connect += time.perf_counter() - context.connection_start - dns
+
+
+def create_trace_config() -> aiohttp.TraceConfig:
+    """Record DNS and connection timings in the FetchStats of a request"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(_on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_end)
+    trace_config.on_connection_create_start.append(_on_connection_start)
+    trace_config.on_connection_create_end.append(_on_connection_end)
+    return trace_config
@@ -0,0 +1,43 @@
+""" Tableau compact des valeurs de toutes les communes """
+from __future__ import annotations
+
+from collections.abc import Collection, Mapping
+
+from .const import AGGREGATE_SENSORS
+from .descriptions import COMPILED_SENSORS
+from .model import RecosanteData
+
+# Columns of the summary: every sensor, then every aggregate sensor
+SUMMARY_KEYS = tuple(sensor.key for sensor in COMPILED_SENSORS) + tuple(
+    description.key for description in AGGREGATE_SENSORS
+)
+SUMMARY_CATEGORIES = tuple(sensor.category for sensor in COMPILED_SENSORS) + tuple(
+    description.category for description in AGGREGATE_SENSORS
+)
+
+
+def summary_row(data: RecosanteData, aggregates: Mapping[str, tuple]) -> tuple:
+    """Values of a commune, in the order of SUMMARY_KEYS"""
+    return tuple(sensor.get_value(data) for sensor in COMPILED_SENSORS) + tuple(
+        aggregates.get(description.key, (None, None))[0]
+        for description in AGGREGATE_SENSORS
+    )
+
+
+def summary(
+    rows: Mapping[str, tuple], categories: Collection[str] | None = None
+) -> dict:
+    """Matrix of the values of every commune, restricted to some categories"""
+    columns = [
+        index
+        for index, category in enumerate(SUMMARY_CATEGORIES)
+        if not categories or category in categories
+    ]
+    if len(columns) == len(SUMMARY_KEYS):
+        values = {insee_code: list(row) for insee_code, row in rows.items()}
+    else:
+        values = {
+            insee_code: [row[index] for index in columns]
+            for insee_code, row in rows.items()
+        }
+    return {"keys": [SUMMARY_KEYS[index] for index in columns], "values": values}
@@ -0,0 +1,54 @@
+""" Commande websocket de l'intégration Recosanté """
+from __future__ import annotations
+
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+import homeassistant.helpers.config_validation as cv
+
+from .const import (
+    CATEGORIES,
+    CONF_CATEGORIES,
+    CONF_CITY,
+    CONF_INSEE_CODE,
+    COORDINATOR,
+    DOMAIN,
+    WS_TYPE_SUMMARY,
+)
+
+
+@callback
+def async_setup_websocket(hass: HomeAssistant) -> None:
+    """Register the websocket commands of the integration"""
+    websocket_api.async_register_command(hass, websocket_summary)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): WS_TYPE_SUMMARY,
+        vol.Optional(CONF_CATEGORIES): vol.All(cv.ensure_list, [vol.In(CATEGORIES)]),
+    }
+)
+@callback
+def websocket_summary(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Values of every sensor of every commune, in one response"""
+    coordinator = hass.data.get(DOMAIN, {}).get(COORDINATOR)
+    if coordinator is None:
+        connection.send_error(
+            msg["id"], websocket_api.const.ERR_NOT_FOUND, "No commune is configured"
+        )
+        return
+    result = coordinator.get_summary(msg.get(CONF_CATEGORIES))
+    result["names"] = {
+        entry.data[CONF_INSEE_CODE]: entry.data.get(CONF_CITY)
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if entry.data.get(CONF_INSEE_CODE) in result["values"]
+    }
+    connection.send_result(msg["id"], result)
@@ -0,0 +1,38 @@
+""" Reconstruit l'index local des codes postaux à partir de geo.api.gouv.fr
+
+Usage: python scripts/update_insee_index.py [communes.json]
+
+Sans argument, la liste des communes est téléchargée depuis geo.api.gouv.fr.
+"""
+import importlib.util
+import json
+import pathlib
+import sys
+import urllib.request
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# The module is loaded on its own, the package needs Home Assistant
+_SPEC = importlib.util.spec_from_file_location(
+    "insee_index", ROOT / "custom_components" / "recosante" / "insee_index.py"
+)
+insee_index = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(insee_index)
+
+
+def main():
+    if len(sys.argv) > 1:
+        communes = json.loads(pathlib.Path(sys.argv[1]).read_text(encoding="utf-8"))
+    else:
+        with urllib.request.urlopen(
+            insee_index.GEO_COMMUNES_URL, timeout=120
+        ) as response:
+            communes = json.load(response)
+
+    index = insee_index.InseeIndex.from_communes(communes)
+    index.save(insee_index.INDEX_PATH)
+    print(f"{len(index)} postal codes written to {insee_index.INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()